@@ -1,12 +1,30 @@
 """FastAPI backend for VibeColor - AI-powered color palette generator"""
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request, Header, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
+from typing import Optional
+import asyncio
+import hashlib
+import hmac
+import json
+import math
 import os
+import random
+import re
+import threading
+import time
 
-from models.schemas import GeneratePaletteRequest, AnalyzeColorRequest, RefinePaletteRequest, Palette, ContrastCheck
+from models.schemas import GeneratePaletteRequest, AnalyzeColorRequest, RefinePaletteRequest, Palette, ContrastCheck, ImageSessionResponse, SimilarPalettesRequest, SimilarPalette, SimilarPalettesResponse, BatchGenerateRequest, JobResponse
 from services.palette_generator import PaletteGenerator
 from services.image_processor import ImageProcessor
+from services.image_session import ImageSessionStore
+from services.profiler import SamplingProfiler, ProfileStore, active_profiler, profiled_thread
+from services.admission import AdmissionController
+from services.ai_service import fallback_only, llm_budget_reserved
+from services.live_palette import LivePalette
+from services.jobs import JobManager, QueueFullError
 
 # Load environment variables
 load_dotenv()
@@ -18,18 +36,117 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Initialize services
+palette_generator = PaletteGenerator()
+image_processor = ImageProcessor()
+image_sessions = ImageSessionStore()
+job_manager = JobManager()
+job_llm_max_wait = float(os.getenv('JOB_LLM_MAX_WAIT', '120'))
+
+# Request profiling (opt-in): admin header or random sampling rate
+profiling_token = os.getenv('PROFILING_ADMIN_TOKEN')
+profiling_sample_rate = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+if profiling_sample_rate > 0 and not profiling_token:
+    # Sampled profiles could never be listed or downloaded without the admin token
+    print("⚠️ PROFILING_SAMPLE_RATE needs PROFILING_ADMIN_TOKEN; request profiling is disabled")
+profile_store = ProfileStore() if profiling_token else None
+
+
+if profile_store:
+    # Only registered when profiling is configured, so it costs nothing otherwise
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        """Capture a sampled stack profile for opted-in requests"""
+        requested = request.headers.get('X-Profile')
+        opted_in = bool(profiling_token and requested and hmac.compare_digest(requested, profiling_token))
+        if not opted_in and random.random() >= profiling_sample_rate:
+            return await call_next(request)
+        
+        # Sample the event loop thread; run_blocking adds worker threads
+        profiler = SamplingProfiler(
+            threading.get_ident(),
+            interval=float(os.getenv('PROFILING_INTERVAL_MS', '5')) / 1000
+        )
+        start = time.perf_counter()
+        profiler.start()
+        token = active_profiler.set(profiler)
+        try:
+            response = await call_next(request)
+        finally:
+            active_profiler.reset(token)
+            stacks = profiler.stop()
+        
+        duration_ms = (time.perf_counter() - start) * 1000
+        response.headers['X-Profile-Id'] = profile_store.save(
+            stacks,
+            label=f"{request.method} {request.url.path}",
+            duration_ms=duration_ms
+        )
+        return response
+
+
+# Admission control: per-endpoint concurrency limits and per-client rate limits
+admission = AdmissionController()
+palette_generator.ai_service.llm_budget = admission.take_llm_token
+
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Rate limit, degrade or shed requests according to endpoint priority"""
+    client = admission.client_id(
+        request.client.host if request.client else None,
+        request.headers.get('X-Forwarded-For')
+    )
+    
+    decision = admission.admit(request.method, request.url.path, client)
+    if decision.rejected:
+        return JSONResponse(
+            status_code=decision.status_code,
+            content={"detail": decision.reason},
+            headers={"Retry-After": str(math.ceil(decision.retry_after))}
+        )
+    
+    # Degraded requests use keyword fallback analysis instead of the LLM
+    token = fallback_only.set(True) if decision.degraded else None
+    try:
+        response = await call_next(request)
+    finally:
+        if token:
+            fallback_only.reset(token)
+        decision.release()
+    
+    if decision.degraded:
+        response.headers['X-Degraded'] = 'fallback-analysis'
+    return response
+
+
 # Configure CORS - allow Vercel deployment
+# Added last so it is the outermost middleware: admission rejections (429/503)
+# also carry CORS headers, and the browser can read Retry-After
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allow all origins for Vercel deployment
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Degraded", "X-Profile-Id"],
 )
 
-# Initialize services
-palette_generator = PaletteGenerator()
-image_processor = ImageProcessor()
+
+async def run_blocking(func, *args, **kwargs):
+    """Run CPU- or network-bound work in the threadpool, keeping the event loop free"""
+    def call():
+        with profiled_thread():
+            return func(*args, **kwargs)
+    return await run_in_threadpool(call)
+
+
+def require_profiling_admin(token: Optional[str]):
+    """Reject profile admin calls unless profiling is on and the token matches"""
+    if not profile_store:
+        raise HTTPException(status_code=404, detail="Profiling is not enabled")
+    if not (profiling_token and token and hmac.compare_digest(token, profiling_token)):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
 
 
 @app.get("/")
@@ -50,7 +167,8 @@ async def generate_palette(request: GeneratePaletteRequest):
     The AI analyzes the emotional context and generates harmonious colors
     """
     try:
-        palette = palette_generator.generate_palette(
+        palette = await run_blocking(
+            palette_generator.generate_palette,
             prompt=request.prompt,
             num_colors=request.num_colors
         )
@@ -81,16 +199,28 @@ async def refine_palette(request: RefinePaletteRequest):
     """
     Refine an existing palette with additional hints
     
-    Combines original prompt with refinement hint for better results
+    With a palette_id the cached analysis is reused and only the hint is
+    applied; otherwise the original prompt and hint are re-analyzed together
     """
     try:
-        # Combine prompts for better context
-        combined_prompt = f"{request.original_prompt}, {request.refinement_hint}"
+        palette = None
+        if request.palette_id:
+            palette = await run_blocking(
+                palette_generator.refine_palette,
+                palette_id=request.palette_id,
+                refinement_hint=request.refinement_hint,
+                num_colors=request.num_colors
+            )
         
-        palette = palette_generator.generate_palette(
-            prompt=combined_prompt,
-            num_colors=request.num_colors
-        )
+        if palette is None:
+            # Combine prompts for better context
+            combined_prompt = f"{request.original_prompt}, {request.refinement_hint}"
+            
+            palette = await run_blocking(
+                palette_generator.generate_palette,
+                prompt=combined_prompt,
+                num_colors=request.num_colors
+            )
         return palette
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to refine palette: {str(e)}")
@@ -103,68 +233,385 @@ async def extract_colors_from_image(file: UploadFile = File(...), num_colors: in
     
     Uses k-means clustering to find the most prominent colors
     """
+    # Validate file type
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    
+    # Validate num_colors
+    if num_colors < 3 or num_colors > 15:
+        raise HTTPException(status_code=400, detail="num_colors must be between 3 and 15")
+    
     try:
-        # Validate file type
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
-        
-        # Validate num_colors
-        if num_colors < 3 or num_colors > 15:
-            raise HTTPException(status_code=400, detail="num_colors must be between 3 and 15")
-        
         # Read image bytes
         image_bytes = await file.read()
         
         # Extract colors using image processor
-        hex_colors = image_processor.extract_colors(image_bytes, num_colors=num_colors)
+        hex_colors = await run_blocking(image_processor.extract_colors, image_bytes, num_colors=num_colors)
         
         # Use AI to generate creative names for the extracted colors
-        # Create a prompt describing the colors
         color_description = f"colors extracted from an image: {', '.join(hex_colors)}"
-        analysis = palette_generator.ai_service.analyze_prompt(color_description)
-        
-        # Build palette with AI-generated names
-        from models.schemas import Color
-        colors = []
-        color_names = analysis.get('color_names', [f'Color {i+1}' for i in range(len(hex_colors))])
+        analysis = await run_blocking(palette_generator.ai_service.analyze_prompt, color_description)
         
-        for i, hex_color in enumerate(hex_colors):
-            rgb = palette_generator.color_engine.hex_to_rgb(hex_color)
-            color_name = color_names[i] if i < len(color_names) else f'Color {i+1}'
-            
-            colors.append(Color(
-                hex=hex_color,
-                rgb=rgb,
-                name=color_name
-            ))
+        # Build palette with AI-generated names and contrast info
+        return palette_generator.build_palette(
+            hex_colors,
+            analysis,
+            theme=f"Extracted from {file.filename}",
+            default_mood='extracted from image'
+        )
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to extract colors: {str(e)}")
+
+
+@app.post("/api/extract-colors/raw", response_model=Palette)
+async def extract_colors_from_pixels(request: Request, width: int, height: int, channels: int = 4, num_colors: int = 5):
+    """
+    Extract dominant colors from raw RGB/RGBA pixels (application/octet-stream)
+    
+    For clients that already hold decoded pixels (e.g. canvas getImageData):
+    the body is used as-is, skipping image encoding and decoding entirely
+    """
+    if num_colors < 3 or num_colors > 15:
+        raise HTTPException(status_code=400, detail="num_colors must be between 3 and 15")
+    
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    if content_type != 'application/octet-stream':
+        raise HTTPException(status_code=415, detail="Content-Type must be application/octet-stream")
+    
+    # Size is known from the dimensions, so check it before reading the body
+    try:
+        expected = image_processor.raw_buffer_size(width, height, channels)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    content_length = request.headers.get('content-length')
+    if content_length is not None and content_length != str(expected):
+        raise HTTPException(status_code=400, detail=f"Expected {expected} bytes for {width}x{height}x{channels}, got Content-Length {content_length}")
+    
+    # Chunked uploads have no Content-Length; stop reading once past the expected size
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > expected:
+            raise HTTPException(status_code=400, detail=f"Expected {expected} bytes for {width}x{height}x{channels}, got more")
+    
+    try:
+        hex_colors = await run_blocking(image_processor.extract_colors_from_pixels, body, width, height, channels, num_colors=num_colors)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        color_description = f"colors extracted from an image: {', '.join(hex_colors)}"
+        analysis = await run_blocking(palette_generator.ai_service.analyze_prompt, color_description)
         
-        # Calculate contrast info
-        contrast_info = []
-        for i in range(len(colors) - 1):
-            ratio = palette_generator.color_engine.calculate_contrast_ratio(
-                colors[i].hex,
-                colors[i + 1].hex
-            )
-            wcag = palette_generator.color_engine.get_wcag_compliance(ratio)
-            
-            from models.schemas import ContrastCheck
-            contrast_info.append(ContrastCheck(
-                ratio=wcag['ratio'],
-                aa_normal=wcag['aa_normal'],
-                aa_large=wcag['aa_large'],
-                aaa_normal=wcag['aaa_normal'],
-                aaa_large=wcag['aaa_large']
-            ))
+        return palette_generator.build_palette(
+            hex_colors,
+            analysis,
+            theme=f"Extracted from {width}x{height} pixels",
+            default_mood='extracted from image'
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to build palette: {str(e)}")
+
+@app.post("/api/images", response_model=ImageSessionResponse)
+async def upload_image(file: UploadFile = File(...)):
+    """
+    Upload an image once and get an image_id for palette queries
+    
+    Palettes for every num_colors in the allowed range are computed up front
+    and named with a single AI call, so follow-up queries are answered from
+    memory
+    """
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    
+    try:
+        image_bytes = await file.read()
+        colors, weights, palettes = await run_blocking(image_processor.extract_color_range, image_bytes)
+        session = image_sessions.create(file.filename, colors, weights, palettes)
         
-        return Palette(
-            colors=colors,
-            theme=f"Extracted from {file.filename}",
-            mood=analysis.get('mood', 'extracted from image'),
-            contrast_info=contrast_info
+        color_description = f"colors extracted from an image: {', '.join(palettes[max(palettes)])}"
+        analysis = await run_blocking(
+            palette_generator.ai_service.analyze_prompt,
+            color_description,
+            num_names=len(palettes[max(palettes)])
         )
+        session.apply_analysis(analysis)
         
+        return ImageSessionResponse(
+            image_id=session.image_id,
+            filename=session.filename,
+            expires_in=image_sessions.ttl_seconds,
+            min_colors=ImageProcessor.MIN_COLORS,
+            max_colors=ImageProcessor.MAX_COLORS
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to analyze contrast: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to process image: {str(e)}")
+
+
+@app.get("/api/images/{image_id}/palette", response_model=Palette)
+async def get_image_palette(image_id: str, num_colors: int = 5):
+    """
+    Get the palette for an uploaded image at the requested size
+    
+    Names come from the single AI analysis made at upload, so no AI call is made here
+    """
+    if num_colors < ImageProcessor.MIN_COLORS or num_colors > ImageProcessor.MAX_COLORS:
+        raise HTTPException(status_code=400, detail="num_colors must be between 3 and 15")
+    
+    session = image_sessions.get(image_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Image session not found or expired")
+    
+    try:
+        return palette_generator.build_palette(
+            session.palettes[num_colors],
+            session.analyses.get(num_colors, {}),
+            theme=f"Extracted from {session.filename}",
+            default_mood='extracted from image'
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to build palette: {str(e)}")
+
+
+@app.post("/api/palettes/similar", response_model=SimilarPalettesResponse)
+async def similar_palettes(request: SimilarPalettesRequest):
+    """
+    Find palettes similar to the given colors
+    
+    Searches the palette library (seeded plus generated and refined palettes)
+    using an order-invariant distance in Lab space. On large libraries the
+    search is approximate (see PaletteIndex) and the response says so
+    """
+    for hex_color in request.colors:
+        if not re.fullmatch(r'#?[0-9A-Fa-f]{6}', hex_color):
+            raise HTTPException(status_code=400, detail=f"Invalid hex color: {hex_color}")
+    
+    try:
+        results = await run_blocking(palette_generator.find_similar, request.colors, limit=request.limit)
+        return SimilarPalettesResponse(
+            palettes=[SimilarPalette(colors=colors, distance=distance) for colors, distance in results],
+            approximate=not palette_generator.palette_index.is_exact(request.limit)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to search palettes: {str(e)}")
+
+
+@app.get("/api/admin/profiles")
+async def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """List recent request profiles (collapsed-stack files), newest first"""
+    require_profiling_admin(x_admin_token)
+    return {"profiles": profile_store.list()}
+
+
+@app.get("/api/admin/profiles/{name}")
+async def download_profile(name: str, x_admin_token: Optional[str] = Header(None)):
+    """
+    Download a request profile
+    
+    The file is in collapsed-stack format, usable with flamegraph.pl or speedscope
+    """
+    require_profiling_admin(x_admin_token)
+    path = profile_store.path(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type='text/plain', filename=name)
+
+
+@app.websocket("/ws/palette")
+async def live_palette_editing(websocket: WebSocket):
+    """
+    Live palette editing session
+    
+    Client sends {"op": "init", "palette_id" | "colors": [...]} and then edit
+    ops (brightness/saturation/temperature with factor and optional index,
+    set, swap, num_colors). Each edit is answered with a delta holding only
+    the changed colors and adjacent contrast checks; AI color names are
+    requested once edits have settled and pushed as a "names" message.
+    """
+    await websocket.accept()
+    palette = None
+    naming_task = None
+    naming_delay = float(os.getenv('LIVE_NAMING_DEBOUNCE_MS', '1500')) / 1000
+    
+    async def name_when_settled(editing: LivePalette, seq: int):
+        await asyncio.sleep(naming_delay)
+        if not editing.unnamed:
+            return
+        description = f"colors in a palette: {', '.join(editing.hex_colors)}"
+        analysis = await asyncio.to_thread(palette_generator.ai_service.analyze_prompt, description)
+        
+        # Newer edits will schedule their own naming
+        if editing.seq != seq:
+            return
+        names = editing.apply_names(analysis.get('color_names', []))
+        if names:
+            await websocket.send_json({'type': 'names', 'seq': seq, 'names': names})
+    
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                if not isinstance(message, dict):
+                    raise ValueError("Message must be a JSON object")
+                
+                if message.get('op') == 'init':
+                    if naming_task:
+                        naming_task.cancel()
+                    
+                    session = palette_generator.sessions.get(message['palette_id']) if message.get('palette_id') else None
+                    if session:
+                        palette = LivePalette(
+                            session.hex_colors,
+                            names=session.analysis.get('color_names'),
+                            theme=session.theme,
+                            mood=session.analysis.get('mood')
+                        )
+                    elif message.get('colors'):
+                        palette = LivePalette(message['colors'], names=message.get('names'), theme=message.get('theme', ''))
+                    else:
+                        raise ValueError("init needs a known palette_id or colors")
+                    
+                    await websocket.send_json(palette.state())
+                    continue
+                
+                if palette is None:
+                    raise ValueError("Send an init op first")
+                
+                seq = palette.seq
+                changed = palette.apply(message)
+                await websocket.send_json(palette.delta(changed))
+                
+                # Restart the debounce timer whenever the palette changed and
+                # some colors need names (swaps and truncation need none)
+                if palette.seq != seq:
+                    if naming_task:
+                        naming_task.cancel()
+                    naming_task = asyncio.create_task(name_when_settled(palette, palette.seq)) if palette.unnamed else None
+            
+            except (ValueError, KeyError, TypeError) as e:
+                await websocket.send_json({'type': 'error', 'detail': str(e)})
+    
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if naming_task:
+            naming_task.cancel()
+
+
+def job_response(job) -> JobResponse:
+    return JobResponse(
+        job_id=job.job_id,
+        kind=job.kind,
+        status=job.status,
+        progress=round(job.progress, 3),
+        result=job.result,
+        error=job.error,
+        created_at=job.created_at,
+        updated_at=job.updated_at
+    )
+
+
+def submit_job(kind: str, key: str, func) -> JobResponse:
+    """Queue a job, or return the existing one for the same key"""
+    try:
+        job = job_manager.submit(kind, key, func)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(admission.retry_after))})
+    return job_response(job)
+
+
+def with_llm_budget(func, *args, **kwargs):
+    """
+    Run func (making one LLM call) in a job worker; returns (result, degraded)
+    
+    Unlike requests, jobs wait up to JOB_LLM_MAX_WAIT seconds for the shared
+    LLM budget; only if none frees up does func use keyword fallback analysis.
+    """
+    if not palette_generator.ai_service.client:
+        return func(*args, **kwargs), False
+    
+    reserved = admission.take_llm_token(max_wait=job_llm_max_wait)
+    flag = llm_budget_reserved if reserved else fallback_only
+    token = flag.set(True)
+    try:
+        return func(*args, **kwargs), not reserved
+    finally:
+        flag.reset(token)
+
+
+@app.post("/api/jobs/extract-colors", response_model=JobResponse, status_code=202)
+async def submit_extract_colors_job(file: UploadFile = File(...), num_colors: int = 5):
+    """
+    Queue color extraction from an uploaded image as a background job
+    
+    Returns immediately; poll GET /api/jobs/{job_id} for progress and the
+    resulting palette, which carries "degraded": true if its color names
+    come from keyword fallback. Re-uploading the same image with the same
+    parameters returns the existing job.
+    """
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    if num_colors < 3 or num_colors > 15:
+        raise HTTPException(status_code=400, detail="num_colors must be between 3 and 15")
+    
+    image_bytes = await file.read()
+    filename = file.filename
+    key = f"extract-colors:{hashlib.sha256(image_bytes).hexdigest()}:{num_colors}"
+    
+    def work(progress):
+        hex_colors = image_processor.extract_colors(image_bytes, num_colors=num_colors)
+        progress(0.7)
+        
+        color_description = f"colors extracted from an image: {', '.join(hex_colors)}"
+        analysis, degraded = with_llm_budget(palette_generator.ai_service.analyze_prompt, color_description)
+        progress(0.9)
+        
+        palette = palette_generator.build_palette(
+            hex_colors,
+            analysis,
+            theme=f"Extracted from {filename}",
+            default_mood='extracted from image'
+        )
+        return {**palette.model_dump(), "degraded": degraded}
+    
+    return submit_job('extract-colors', key, work)
+
+
+@app.post("/api/jobs/generate-batch", response_model=JobResponse, status_code=202)
+async def submit_generate_batch_job(request: BatchGenerateRequest):
+    """
+    Queue palette generation for a batch of prompts as a background job
+    
+    The job result is {"palettes": [...], "degraded": [...]}: palettes in
+    prompt order, and the indices of those generated with keyword fallback
+    because no LLM budget freed up within JOB_LLM_MAX_WAIT.
+    """
+    body = json.dumps(request.model_dump(), sort_keys=True)
+    key = f"generate-batch:{hashlib.sha256(body.encode()).hexdigest()}"
+    prompts, num_colors = list(request.prompts), request.num_colors
+    
+    def work(progress):
+        palettes, degraded = [], []
+        for i, prompt in enumerate(prompts):
+            palette, fell_back = with_llm_budget(palette_generator.generate_palette, prompt=prompt, num_colors=num_colors)
+            palettes.append(palette.model_dump())
+            if fell_back:
+                degraded.append(i)
+            progress((i + 1) / len(prompts))
+        return {"palettes": palettes, "degraded": degraded}
+    
+    return submit_job('generate-batch', key, work)
+
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """Status, progress and (once finished) result of a background job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job_response(job)
 
 
 @app.get("/health")
@@ -182,8 +629,15 @@ async def health_check():
         "features": {
             "palette_generation": True,
             "contrast_analysis": True,
-            "wcag_compliance": True
-        }
+            "wcag_compliance": True,
+            "image_sessions": True,
+            "similar_palettes": True,
+            "live_editing": True,
+            "background_jobs": True
+        },
+        "palette_index_size": palette_generator.palette_index.size,
+        "admission": admission.snapshot(),
+        "jobs": job_manager.stats()
     }
 
 
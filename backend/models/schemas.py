@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Annotated, List, Optional
 
 
 class Color(BaseModel):
@@ -7,8 +7,8 @@ class Color(BaseModel):
     hex: str = Field(..., description="Hex color code (e.g., #FF5733)")
     rgb: dict = Field(..., description="RGB values {r, g, b}")
     name: Optional[str] = Field(None, description="AI-generated color name")
-    
-    
+
+
 class ContrastCheck(BaseModel):
     """WCAG contrast ratio information"""
     ratio: float
@@ -24,6 +24,7 @@ class Palette(BaseModel):
     theme: str = Field(..., description="Original user prompt/theme")
     mood: Optional[str] = Field(None, description="Detected mood from AI")
     contrast_info: Optional[List[ContrastCheck]] = Field(None, description="Contrast between colors")
+    palette_id: Optional[str] = Field(None, description="Id for incremental refinement via /api/refine")
 
 
 class GeneratePaletteRequest(BaseModel):
@@ -43,4 +44,50 @@ class RefinePaletteRequest(BaseModel):
     original_prompt: str = Field(..., min_length=1, max_length=500, description="Original palette prompt")
     refinement_hint: str = Field(..., min_length=1, max_length=500, description="Additional refinement hint")
     num_colors: int = Field(5, ge=3, le=15, description="Number of colors to generate")
+    palette_id: Optional[str] = Field(None, description="palette_id of the palette being refined")
+
+
+
+class ImageSessionResponse(BaseModel):
+    """Uploaded image session that can be queried for any palette size"""
+    image_id: str = Field(..., description="Session id for follow-up palette queries")
+    filename: Optional[str] = Field(None, description="Original upload filename")
+    expires_in: int = Field(..., description="Seconds of inactivity before the session is evicted")
+    min_colors: int = Field(..., description="Smallest available num_colors")
+    max_colors: int = Field(..., description="Largest available num_colors")
+
+
+class SimilarPalettesRequest(BaseModel):
+    """Request for palettes perceptually similar to the given colors"""
+    colors: List[str] = Field(..., min_length=1, max_length=15, description="Hex color codes of the query palette")
+    limit: int = Field(10, ge=1, le=50, description="Maximum number of palettes to return")
+
+
+class SimilarPalette(BaseModel):
+    """One similar-palette search hit"""
+    colors: List[str] = Field(..., description="Hex color codes")
+    distance: float = Field(..., description="Order-invariant Lab distance to the query (lower is closer)")
+
+
+class SimilarPalettesResponse(BaseModel):
+    """Similar-palette search results, nearest first"""
+    palettes: List[SimilarPalette]
+    approximate: bool = Field(False, description="True when only a candidate subset of the library was ranked exactly, so close matches may be missing")
+
+
+class BatchGenerateRequest(BaseModel):
+    """Request to generate palettes for many prompts as a background job"""
+    prompts: List[Annotated[str, Field(min_length=1, max_length=500)]] = Field(..., min_length=1, max_length=100, description="Text descriptions, one palette each")
+    num_colors: int = Field(5, ge=3, le=15, description="Number of colors per palette")
+
 
+class JobResponse(BaseModel):
+    """Status of a background job"""
+    job_id: str
+    kind: str = Field(..., description="extract-colors or generate-batch")
+    status: str = Field(..., description="queued, running, succeeded or failed")
+    progress: float = Field(..., description="Completion between 0 and 1")
+    result: Optional[dict] = Field(None, description="Job result once succeeded")
+    error: Optional[str] = Field(None, description="Error message if failed")
+    created_at: float
+    updated_at: float
@@ -0,0 +1,233 @@
+"""Admission control: per-endpoint concurrency limits and per-client token buckets"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens per second"""
+    
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+    
+    def take(self) -> float:
+        """Take one token; returns 0 on success, else seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class EndpointPolicy:
+    """Limits for one class of endpoints"""
+    
+    def __init__(self, name: str, priority: int, concurrency: int, rate: float, burst: float,
+                 hard_concurrency: Optional[int] = None, uses_llm: bool = False):
+        self.name = name
+        self.priority = priority              # Lower is more important; informational
+        self.concurrency = concurrency        # Above this: degrade (if possible) or reject
+        self.hard_concurrency = hard_concurrency  # Degradable classes reject only above this
+        self.rate = rate                      # Per-client requests per second
+        self.burst = burst
+        self.uses_llm = uses_llm
+        self.in_flight = 0
+        self.admitted = 0
+        self.degraded = 0
+        self.rejected = 0
+
+
+class Admission:
+    """Outcome of an admission check; must be released when the request finishes"""
+    
+    def __init__(self, controller: 'AdmissionController', policy: Optional[EndpointPolicy],
+                 degraded: bool = False, status_code: int = 200, retry_after: float = 0, reason: str = ''):
+        self.controller = controller
+        self.policy = policy
+        self.degraded = degraded
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+    
+    @property
+    def rejected(self) -> bool:
+        return self.status_code != 200
+    
+    def release(self):
+        if self.policy and not self.rejected:
+            self.controller._release(self.policy)
+
+
+class AdmissionController:
+    """
+    Decides per request whether to run, degrade or shed it
+    
+    Order of checks: per-client token bucket (429), then endpoint concurrency.
+    LLM-backed classes degrade to keyword fallback analysis above their soft
+    concurrency limit and are only rejected (503) above the hard limit; other
+    classes are shed with 503. Individual LLM calls additionally draw from a
+    shared budget (take_llm_token) and fall back when it is exhausted.
+    """
+    
+    MAX_CLIENTS = 10000
+    
+    def __init__(self):
+        def env(name, default):
+            return float(os.getenv(name, default))
+        
+        self.policies: Dict[str, EndpointPolicy] = {
+            'analyze': EndpointPolicy(
+                'analyze', priority=0,
+                concurrency=int(env('ADMISSION_ANALYZE_CONCURRENCY', '64')),
+                rate=env('ADMISSION_ANALYZE_RATE', '20'), burst=env('ADMISSION_ANALYZE_BURST', '40')
+            ),
+            'generate': EndpointPolicy(
+                'generate', priority=1,
+                concurrency=int(env('ADMISSION_GENERATE_CONCURRENCY', '8')),
+                hard_concurrency=int(env('ADMISSION_GENERATE_HARD_CONCURRENCY', '32')),
+                rate=env('ADMISSION_GENERATE_RATE', '1'), burst=env('ADMISSION_GENERATE_BURST', '5'),
+                uses_llm=True
+            ),
+            'extract': EndpointPolicy(
+                'extract', priority=2,
+                concurrency=int(env('ADMISSION_EXTRACT_CONCURRENCY', '4')),
+                rate=env('ADMISSION_EXTRACT_RATE', '0.5'), burst=env('ADMISSION_EXTRACT_BURST', '3'),
+                uses_llm=True
+            ),
+            # Job submits only queue work (the job queue bounds the backlog), so
+            # they are never degraded; workers wait for the LLM budget instead
+            'jobs': EndpointPolicy(
+                'jobs', priority=3,
+                concurrency=int(env('ADMISSION_JOBS_CONCURRENCY', '16')),
+                rate=env('ADMISSION_JOBS_RATE', '0.2'), burst=env('ADMISSION_JOBS_BURST', '5')
+            ),
+        }
+        
+        # Endpoint path -> policy name (POST only; reads are not limited)
+        self.routes = {
+            '/api/analyze': 'analyze',
+            '/api/generate': 'generate',
+            '/api/refine': 'generate',
+            '/api/extract-colors': 'extract',
+            '/api/extract-colors/raw': 'extract',
+            '/api/images': 'extract',
+            '/api/jobs/extract-colors': 'jobs',
+            '/api/jobs/generate-batch': 'jobs',
+        }
+        
+        # Shared LLM budget (e.g. Groq requests per minute) across all clients
+        llm_per_minute = env('LLM_REQUESTS_PER_MINUTE', '30')
+        self.llm_bucket = TokenBucket(rate=llm_per_minute / 60, burst=max(1.0, llm_per_minute / 6))
+        self.retry_after = env('ADMISSION_RETRY_AFTER', '2')
+        
+        # Proxies in front of the app that append to X-Forwarded-For; 0 means
+        # the header is ignored, since clients can set it to anything
+        self.trusted_proxy_hops = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+        
+        self._buckets: 'OrderedDict[tuple, TokenBucket]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def client_id(self, remote_addr: Optional[str], forwarded_for: Optional[str]) -> str:
+        """
+        Identify the client for rate limiting
+        
+        Uses the connection's peer address, or with TRUSTED_PROXY_HOPS = n the
+        n-th X-Forwarded-For entry from the right (the one written by the
+        outermost trusted proxy). Entries further left are client-supplied.
+        """
+        if self.trusted_proxy_hops > 0 and forwarded_for:
+            entries = [e.strip() for e in forwarded_for.split(',')]
+            if len(entries) >= self.trusted_proxy_hops:
+                return entries[-self.trusted_proxy_hops]
+        return remote_addr or 'unknown'
+    
+    def admit(self, method: str, path: str, client: str) -> Admission:
+        """Check a request against its endpoint policy"""
+        name = self.routes.get(path) if method == 'POST' else None
+        if name is None:
+            return Admission(self, None)
+        policy = self.policies[name]
+        
+        with self._lock:
+            wait = self._bucket(policy, client).take()
+            if wait > 0:
+                policy.rejected += 1
+                return Admission(self, policy, status_code=429, retry_after=wait, reason='Rate limit exceeded')
+            
+            degraded = False
+            if policy.in_flight >= policy.concurrency:
+                if policy.uses_llm and policy.hard_concurrency and policy.in_flight < policy.hard_concurrency:
+                    degraded = True
+                else:
+                    policy.rejected += 1
+                    return Admission(self, policy, status_code=503, retry_after=self.retry_after, reason='Server busy')
+            
+            policy.in_flight += 1
+            policy.admitted += 1
+            if degraded:
+                policy.degraded += 1
+            return Admission(self, policy, degraded=degraded)
+    
+    def take_llm_token(self, max_wait: float = 0) -> bool:
+        """
+        Spend one request of the shared LLM budget
+        
+        Waits up to max_wait seconds for a token (background work only;
+        requests pass 0). False when none is available in time.
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                wait = self.llm_bucket.take()
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+    
+    def snapshot(self) -> dict:
+        """Limiter state for /health"""
+        with self._lock:
+            return {
+                'endpoints': {
+                    name: {
+                        'priority': p.priority,
+                        'in_flight': p.in_flight,
+                        'concurrency_limit': p.concurrency,
+                        'hard_concurrency_limit': p.hard_concurrency,
+                        'rate_per_client': p.rate,
+                        'burst_per_client': p.burst,
+                        'admitted': p.admitted,
+                        'degraded': p.degraded,
+                        'rejected': p.rejected,
+                    }
+                    for name, p in self.policies.items()
+                },
+                'llm_tokens_available': round(self.llm_bucket.tokens, 2),
+                'tracked_clients': len(self._buckets),
+            }
+    
+    def _bucket(self, policy: EndpointPolicy, client: str) -> TokenBucket:
+        """Per-client bucket for a policy, LRU-bounded (caller holds lock)"""
+        key = (policy.name, client)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(policy.rate, policy.burst)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.MAX_CLIENTS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+    
+    def _release(self, policy: EndpointPolicy):
+        with self._lock:
+            policy.in_flight -= 1
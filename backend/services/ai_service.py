@@ -1,13 +1,35 @@
 """AI service for semantic analysis of text to extract color emotions and themes"""
 import os
-from typing import Optional
+from contextvars import ContextVar
+from typing import Callable, Optional
 from openai import OpenAI
 from groq import Groq
 
+# Set per request by admission control to serve keyword fallbacks under load
+fallback_only: ContextVar[bool] = ContextVar('fallback_only', default=False)
+
+# Set by callers that already took a token from the shared LLM budget for
+# the single LLM call they make under it (e.g. background jobs that wait)
+llm_budget_reserved: ContextVar[bool] = ContextVar('llm_budget_reserved', default=False)
+
 
 class AIService:
     """Handles LLM-based semantic analysis for color generation"""
     
+    # Simple keyword-based color selection used when no AI provider is configured
+    FALLBACK_COLOR_MAP = {
+        'sunset': {'mood': 'warm and romantic', 'base_color': '#FF6B6B', 'color_names': ['Sunset Coral', 'Golden Hour', 'Dusk Rose', 'Amber Glow', 'Twilight Purple']},
+        'ocean': {'mood': 'calm and serene', 'base_color': '#4ECDC4', 'color_names': ['Ocean Teal', 'Deep Sea', 'Wave Blue', 'Seafoam', 'Coral Reef']},
+        'forest': {'mood': 'natural and grounding', 'base_color': '#2D6A4F', 'color_names': ['Forest Green', 'Moss', 'Pine', 'Fern', 'Sage']},
+        'corporate': {'mood': 'professional and trustworthy', 'base_color': '#2C3E50', 'color_names': ['Navy Blue', 'Slate Grey', 'Steel', 'Charcoal', 'Silver']},
+        'vintage': {'mood': 'nostalgic and warm', 'base_color': '#D4A574', 'color_names': ['Vintage Gold', 'Sepia', 'Antique Brass', 'Faded Rose', 'Parchment']},
+        'neon': {'mood': 'energetic and bold', 'base_color': '#FF006E', 'color_names': ['Electric Pink', 'Neon Green', 'Cyber Blue', 'Volt Yellow', 'Hot Magenta']},
+        'pastel': {'mood': 'soft and gentle', 'base_color': '#B4A7D6', 'color_names': ['Lavender', 'Mint', 'Peach', 'Baby Blue', 'Soft Pink']},
+        'cyberpunk': {'mood': 'futuristic and electric', 'base_color': '#FF00FF', 'color_names': ['Neon Magenta', 'Cyber Blue', 'Electric Green', 'Hot Pink', 'Digital Purple']},
+        'spring': {'mood': 'fresh and vibrant', 'base_color': '#90EE90', 'color_names': ['Spring Green', 'Blossom Pink', 'Sky Blue', 'Sunshine Yellow', 'Fresh Mint']},
+        'autumn': {'mood': 'cozy and warm', 'base_color': '#D2691E', 'color_names': ['Autumn Orange', 'Maple Red', 'Golden Brown', 'Rust', 'Harvest Gold']},
+    }
+    
     def __init__(self):
         # Try Groq first (free and fast!)
         groq_key = os.getenv('GROQ_API_KEY')
@@ -25,26 +47,40 @@ class AIService:
             print("⚠️ No API key found. Using fallback mode (keyword-based).")
             self.client = None
             self.provider = None
+        
+        # Optional shared LLM budget; returns False when no call may be made
+        self.llm_budget: Optional[Callable[[], bool]] = None
+    
+    def _llm_available(self) -> bool:
+        """Whether this call may use the LLM (configured, not degraded, within budget)"""
+        if not self.client or fallback_only.get():
+            return False
+        if llm_budget_reserved.get():
+            return True
+        return self.llm_budget is None or self.llm_budget()
     
-    def analyze_prompt(self, prompt: str) -> dict:
+    def analyze_prompt(self, prompt: str, num_names: int = 5) -> dict:
         """
         Analyze user prompt to extract emotional context and color preferences
+        Asks for num_names color names (the keyword fallback always has 5)
         Returns: {'mood': str, 'base_color': str, 'color_names': list}
         """
-        if not self.client:
+        if not self._llm_available():
             return self._fallback_analysis(prompt)
         
         try:
             # System prompt for AI
-            system_prompt = """You are a color theory expert and designer. When given a text prompt, 
+            example_names = ', '.join(f'"name{i+1}"' for i in range(num_names))
+            system_prompt = f"""You are a color theory expert and designer. When given a text prompt, 
             analyze its emotional tone and suggest appropriate colors. Respond in JSON format with:
-            {
+            {{
                 "mood": "brief mood description",
                 "base_color": "hex color code that captures the essence",
-                "color_names": ["name1", "name2", "name3", "name4", "name5"]
-            }
+                "color_names": [{example_names}]
+            }}
             
-            The color_names should be creative, evocative names for each color in the palette.
+            The color_names should be {num_names} creative, evocative names for each color in the palette,
+            in the order of any colors listed in the prompt.
             Base your suggestions on:
             - Emotional tone (warm, cool, energetic, calm)
             - Cultural associations (sunset = orange/pink, ocean = blue/teal)
@@ -66,35 +102,72 @@ class AIService:
                 ],
                 response_format={"type": "json_object"} if self.provider == 'groq' else {"type": "json_object"},
                 temperature=0.7,
-                max_tokens=300
+                max_tokens=300 + 15 * max(0, num_names - 5)
             )
             
             import json
             result = json.loads(response.choices[0].message.content)
             return result
-            
+        
         except Exception as e:
             print(f"❌ AI analysis error: {e}")
             print("📌 Falling back to keyword mode...")
             return self._fallback_analysis(prompt)
     
+    def refine_analysis(self, analysis: dict, refinement_hint: str) -> dict:
+        """
+        Update a previous analysis with a refinement hint using a compact delta request
+        Returns: {'mood': str, 'base_color': str, 'color_names': list}
+        """
+        if not self._llm_available():
+            return self._fallback_refinement(analysis, refinement_hint)
+        
+        try:
+            import json
+            
+            # Only the previous result and the hint are sent, not the full design brief
+            previous = {
+                'mood': analysis.get('mood'),
+                'base_color': analysis.get('base_color')
+            }
+            
+            if self.provider == 'groq':
+                model = "llama-3.3-70b-versatile"
+            else:  # openai
+                model = "gpt-3.5-turbo"
+            
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": 'Adjust a color palette analysis. Reply JSON: {"mood": str, "base_color": hex, "color_names": [5 names]}'},
+                    {"role": "user", "content": f"Previous: {json.dumps(previous)}\nChange: {refinement_hint}"}
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.7,
+                max_tokens=120
+            )
+            
+            result = json.loads(response.choices[0].message.content)
+            return {**analysis, **result}
+        
+        except Exception as e:
+            print(f"❌ AI refinement error: {e}")
+            print("📌 Falling back to keyword mode...")
+            return self._fallback_refinement(analysis, refinement_hint)
+    
+    def _fallback_refinement(self, analysis: dict, refinement_hint: str) -> dict:
+        """Fallback refinement: keyword match on the hint, else keep the previous analysis"""
+        hinted = self._fallback_analysis(refinement_hint)
+        if hinted['base_color'] != '#6366F1':
+            return hinted
+        return analysis
+    
     def _fallback_analysis(self, prompt: str) -> dict:
         """Fallback analysis when AI is not available"""
         prompt_lower = prompt.lower()
         
         # Simple keyword-based color selection
-        color_map = {
-            'sunset': {'mood': 'warm and romantic', 'base_color': '#FF6B6B', 'color_names': ['Sunset Coral', 'Golden Hour', 'Dusk Rose', 'Amber Glow', 'Twilight Purple']},
-            'ocean': {'mood': 'calm and serene', 'base_color': '#4ECDC4', 'color_names': ['Ocean Teal', 'Deep Sea', 'Wave Blue', 'Seafoam', 'Coral Reef']},
-            'forest': {'mood': 'natural and grounding', 'base_color': '#2D6A4F', 'color_names': ['Forest Green', 'Moss', 'Pine', 'Fern', 'Sage']},
-            'corporate': {'mood': 'professional and trustworthy', 'base_color': '#2C3E50', 'color_names': ['Navy Blue', 'Slate Grey', 'Steel', 'Charcoal', 'Silver']},
-            'vintage': {'mood': 'nostalgic and warm', 'base_color': '#D4A574', 'color_names': ['Vintage Gold', 'Sepia', 'Antique Brass', 'Faded Rose', 'Parchment']},
-            'neon': {'mood': 'energetic and bold', 'base_color': '#FF006E', 'color_names': ['Electric Pink', 'Neon Green', 'Cyber Blue', 'Volt Yellow', 'Hot Magenta']},
-            'pastel': {'mood': 'soft and gentle', 'base_color': '#B4A7D6', 'color_names': ['Lavender', 'Mint', 'Peach', 'Baby Blue', 'Soft Pink']},
-            'cyberpunk': {'mood': 'futuristic and electric', 'base_color': '#FF00FF', 'color_names': ['Neon Magenta', 'Cyber Blue', 'Electric Green', 'Hot Pink', 'Digital Purple']},
-            'spring': {'mood': 'fresh and vibrant', 'base_color': '#90EE90', 'color_names': ['Spring Green', 'Blossom Pink', 'Sky Blue', 'Sunshine Yellow', 'Fresh Mint']},
-            'autumn': {'mood': 'cozy and warm', 'base_color': '#D2691E', 'color_names': ['Autumn Orange', 'Maple Red', 'Golden Brown', 'Rust', 'Harvest Gold']},
-        }
+        color_map = self.FALLBACK_COLOR_MAP
         
         for keyword, colors in color_map.items():
             if keyword in prompt_lower:
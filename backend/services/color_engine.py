@@ -1,6 +1,7 @@
 """Color mathematics engine for conversions, contrast, and WCAG compliance"""
 import colorsys
 import re
+import numpy as np
 from typing import Tuple, Dict
 from colormath.color_objects import sRGBColor, LabColor
 from colormath.color_conversions import convert_color
@@ -31,6 +32,29 @@ class ColorEngine:
         lab = convert_color(rgb, LabColor)
         return (lab.lab_l, lab.lab_a, lab.lab_b)
     
+    @staticmethod
+    def rgb_array_to_lab(rgb: np.ndarray) -> np.ndarray:
+        """Vectorized sRGB (0-255, shape [..., 3]) to CIE Lab (D65) conversion"""
+        c = np.asarray(rgb, dtype=np.float32) / 255.0
+        linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+        
+        # Linear sRGB -> XYZ, normalized by the D65 white point
+        matrix = np.array([
+            [0.4124564, 0.3575761, 0.1804375],
+            [0.2126729, 0.7151522, 0.0721750],
+            [0.0193339, 0.1191920, 0.9503041]
+        ], dtype=np.float32)
+        xyz = linear @ matrix.T / np.array([0.95047, 1.0, 1.08883], dtype=np.float32)
+        
+        delta = 6 / 29
+        f = np.where(xyz > delta ** 3, np.cbrt(xyz), xyz / (3 * delta ** 2) + 4 / 29)
+        
+        lab = np.empty_like(f)
+        lab[..., 0] = 116 * f[..., 1] - 16
+        lab[..., 1] = 500 * (f[..., 0] - f[..., 1])
+        lab[..., 2] = 200 * (f[..., 1] - f[..., 2])
+        return lab
+    
     @staticmethod
     def calculate_relative_luminance(r: int, g: int, b: int) -> float:
         """Calculate relative luminance for WCAG contrast calculations"""
@@ -83,6 +107,35 @@ class ColorEngine:
         r, g, b = colorsys.hls_to_rgb(h, l, s)
         return ColorEngine.rgb_to_hex(int(r * 255), int(g * 255), int(b * 255))
     
+    @staticmethod
+    def adjust_saturation(hex_color: str, factor: float) -> str:
+        """Adjust saturation of a color (factor: -1 to 1)"""
+        rgb = ColorEngine.hex_to_rgb(hex_color)
+        h, l, s = colorsys.rgb_to_hls(rgb['r']/255, rgb['g']/255, rgb['b']/255)
+        
+        # Adjust saturation
+        s = max(0, min(1, s + factor * 0.3))
+        
+        r, g, b = colorsys.hls_to_rgb(h, l, s)
+        return ColorEngine.rgb_to_hex(int(r * 255), int(g * 255), int(b * 255))
+    
+    @staticmethod
+    def adjust_temperature(hex_color: str, factor: float) -> str:
+        """Shift hue toward orange (factor > 0) or blue (factor < 0), factor: -1 to 1"""
+        rgb = ColorEngine.hex_to_rgb(hex_color)
+        h, l, s = colorsys.rgb_to_hls(rgb['r']/255, rgb['g']/255, rgb['b']/255)
+        
+        # Warm pole ~30 degrees, cool pole ~210 degrees
+        target = 30 / 360 if factor > 0 else 210 / 360
+        
+        # Move along the shortest arc without overshooting the pole
+        delta = (target - h + 0.5) % 1.0 - 0.5
+        step = min(abs(delta), abs(factor) * 0.08)
+        h = (h + step * (1 if delta >= 0 else -1)) % 1.0
+        
+        r, g, b = colorsys.hls_to_rgb(h, l, s)
+        return ColorEngine.rgb_to_hex(int(r * 255), int(g * 255), int(b * 255))
+    
     @staticmethod
     def generate_harmony_colors(base_hex: str, num_colors: int = 5) -> list[str]:
         """Generate harmonious colors based on a base color using color theory"""
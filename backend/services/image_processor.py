@@ -6,250 +6,386 @@ import io
 from io import BytesIO
 import logging
 import colorsys
-from typing import List
+from typing import Dict, List, Tuple
 
 
 class ImageProcessor:
     """Extracts dominant colors from images using k-means clustering"""
     
+    # Range of palette sizes accepted by the API
+    MIN_COLORS = 3
+    MAX_COLORS = 15
+    
+    # Above this many distinct colors, pixels are quantized before clustering
+    MAX_UNIQUE_COLORS = 25000
+    
+    # Largest raw pixel buffer accepted without decoding (width * height)
+    MAX_RAW_PIXELS = 1024 * 1024
+    
     def __init__(self):
         pass
     
     def extract_colors(self, image_bytes: bytes, num_colors: int = 5) -> List[str]:
         """
-        Extract dominant colors from image using improved k-means clustering
-        with stratified multi-region sampling
+        Extract dominant colors from image using weighted k-means clustering
+        over the image's unique colors
         
         Args:
             image_bytes: Raw image bytes
             num_colors: Number of colors to extract
-            
+        
         Returns:
             List of hex color codes
         """
         try:
-            # Load image from bytes
-            image = Image.open(BytesIO(image_bytes))
-            
-            # Convert to RGB if needed (e.g., PNG with alpha channel)
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Resize for faster processing BUT keep larger for better accuracy
-            # Increased to 600px for maximum accuracy while maintaining performance
-            max_size = 600
-            image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-            
-            # Convert image to numpy array
-            img_array = np.array(image)
-            height, width = img_array.shape[:2]
-            
-            # STRATIFIED SAMPLING: Sample from different regions of image
-            # This ensures we capture colors from all parts of the image
-            # not just random pixels which might miss important regions
-            
-            # Divide image into grid (4x4 = 16 regions)
-            grid_rows = 4
-            grid_cols = 4
-            region_height = height // grid_rows
-            region_width = width // grid_cols
-            
-            # Sample pixels from each region
-            sampled_pixels = []
-            pixels_per_region = 3000  # Sample ~3000 pixels per region (increased from 2000 for MAXIMUM accuracy)
-            
-            for row in range(grid_rows):
-                for col in range(grid_cols):
-                    # Get region bounds
-                    y_start = row * region_height
-                    y_end = (row + 1) * region_height if row < grid_rows - 1 else height
-                    x_start = col * region_width
-                    x_end = (col + 1) * region_width if col < grid_cols - 1 else width
-                    
-                    # Extract region
-                    region = img_array[y_start:y_end, x_start:x_end]
-                    region_pixels = region.reshape(-1, 3)
-                    
-                    # Sample from this region
-                    if len(region_pixels) > pixels_per_region:
-                        indices = np.random.choice(len(region_pixels), pixels_per_region, replace=False)
-                        region_sample = region_pixels[indices]
-                    else:
-                        region_sample = region_pixels
-                    
-                    sampled_pixels.append(region_sample)
-            
-            # Combine all sampled pixels
-            pixels = np.vstack(sampled_pixels)
-            
-            # Advanced noise filtering
-            # Remove pure black (< 10), pure white (> 245), and very grey pixels
-            brightness = pixels.mean(axis=1)
-            saturation = pixels.std(axis=1)
-            
-            # Keep pixels that are:
-            # - Not too dark (brightness > 10)
-            # - Not too bright (brightness < 245)
-            # - Have some saturation (std > 3) OR are intentionally grey/black/white
-            # Relaxed from >5 to >3 to keep more color data
-            mask = (brightness > 10) & (brightness < 245) & ((saturation > 3) | (brightness < 30) | (brightness > 220))
-            filtered_pixels = pixels[mask]
-            
-            # If too few pixels left, use less aggressive filtering
-            if len(filtered_pixels) < 500:
-                mask = (brightness > 5) & (brightness < 250)
-                filtered_pixels = pixels[mask]
+            img_array = self._decode_image(image_bytes)
+            return self._extract_from_array(img_array, num_colors)
+        
+        except Exception as e:
+            print(f"Error extracting colors from image: {e}")
+            raise ValueError(f"Failed to process image: {str(e)}")
+    
+    def extract_colors_from_pixels(self, buffer: bytes, width: int, height: int, channels: int, num_colors: int = 5) -> List[str]:
+        """
+        Extract dominant colors from a raw, already-decoded pixel buffer
+        
+        The buffer is wrapped without copying or decoding; only its size is
+        validated against the given dimensions.
+        
+        Args:
+            buffer: Row-major 8-bit RGB or RGBA pixel data
+            width: Image width in pixels
+            height: Image height in pixels
+            channels: 3 (RGB) or 4 (RGBA)
+            num_colors: Number of colors to extract
+        
+        Returns:
+            List of hex color codes
+        """
+        expected = self.raw_buffer_size(width, height, channels)
+        if len(buffer) != expected:
+            raise ValueError(f"Expected {expected} bytes for {width}x{height}x{channels}, got {len(buffer)}")
+        
+        img_array = np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, channels)
+        return self._extract_from_array(img_array, num_colors)
+    
+    def raw_buffer_size(self, width: int, height: int, channels: int) -> int:
+        """
+        Validate raw pixel dimensions and return the expected buffer size in bytes
+        
+        Lets callers reject oversized uploads before reading the body.
+        """
+        if channels not in (3, 4):
+            raise ValueError("channels must be 3 (RGB) or 4 (RGBA)")
+        if width <= 0 or height <= 0:
+            raise ValueError("width and height must be positive")
+        if width * height > self.MAX_RAW_PIXELS:
+            raise ValueError(f"Image must have at most {self.MAX_RAW_PIXELS} pixels")
+        return width * height * channels
+    
+    def _extract_from_array(self, img_array: np.ndarray, num_colors: int) -> List[str]:
+        """Cluster the unique colors of an H x W x 3/4 pixel array"""
+        colors, weights = self._sample_pixels(img_array)
+        
+        # Apply k-means clustering with more iterations for better accuracy
+        # Increased n_init from 10 to 20 for better convergence
+        kmeans = KMeans(
+            n_clusters=min(num_colors, len(colors)), 
+            random_state=42, 
+            n_init=20,
+            max_iter=500  # More iterations for better convergence
+        )
+        kmeans.fit(colors, sample_weight=weights)
+        
+        return self._rank_colors(colors, weights, kmeans.cluster_centers_, kmeans.labels_, num_colors)
+    
+    def extract_color_range(self, image_bytes: bytes) -> Tuple[np.ndarray, np.ndarray, Dict[int, List[str]]]:
+        """
+        Extract palettes for every allowed num_colors in a single pass
+        
+        Fits k-means once at MAX_COLORS, then merges clusters bottom-up
+        (Ward linkage on the fitted centroids) down to MIN_COLORS. Each
+        merged level is polished with a short k-means run seeded from the
+        merged centers, so no level pays for a fresh n_init=20 fit.
+        
+        Args:
+            image_bytes: Raw image bytes
+        
+        Returns:
+            Tuple of (unique colors as uint8 array, their pixel counts, {num_colors: hex colors})
+        """
+        try:
+            img_array = self._decode_image(image_bytes)
+            colors, weights = self._sample_pixels(img_array)
+            return colors.astype(np.uint8), weights, self._cluster_range(colors, weights)
+        
+        except Exception as e:
+            print(f"Error extracting colors from image: {e}")
+            raise ValueError(f"Failed to process image: {str(e)}")
+    
+    def _decode_image(self, image_bytes: bytes) -> np.ndarray:
+        """Decode image bytes into a downscaled RGB pixel array"""
+        # Load image from bytes
+        image = Image.open(BytesIO(image_bytes))
+        
+        # Convert to RGB if needed (e.g., PNG with alpha channel)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        # Resize for faster processing BUT keep larger for better accuracy
+        # Increased to 600px for maximum accuracy while maintaining performance
+        max_size = 600
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        
+        # Convert image to numpy array
+        img_array = np.array(image)
+        return img_array
+    
+    def _sample_pixels(self, img_array: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Reduce every pixel of the image to weighted unique colors
+        
+        Returns:
+            Tuple of (unique colors as float N x 3 array, pixel count per color)
+        """
+        pixels = img_array.reshape(-1, img_array.shape[-1])
+        
+        # RGBA input: ignore fully transparent pixels
+        if pixels.shape[1] == 4:
+            opaque = pixels[:, 3] > 0
+            pixels = pixels[opaque, :3] if opaque.any() else pixels[:, :3]
+        
+        colors, weights = self._compress_colors(pixels)
+        
+        # Advanced noise filtering
+        # Remove pure black (< 10), pure white (> 245), and very grey pixels
+        brightness = colors.mean(axis=1)
+        saturation = colors.std(axis=1)
+        total = weights.sum()
+        
+        # Keep pixels that are:
+        # - Not too dark (brightness > 10)
+        # - Not too bright (brightness < 245)
+        # - Have some saturation (std > 3) OR are intentionally grey/black/white
+        # Relaxed from >5 to >3 to keep more color data
+        mask = (brightness > 10) & (brightness < 245) & ((saturation > 3) | (brightness < 30) | (brightness > 220))
+        
+        # If too few pixels left (~1% of the image), use less aggressive filtering
+        if weights[mask].sum() < total * 0.01:
+            mask = (brightness > 5) & (brightness < 250)
+        
+        # If still too few, use original
+        if weights[mask].sum() < total * 0.002:
+            mask = np.ones(len(colors), dtype=bool)
+        
+        return colors[mask], weights[mask]
+    
+    def _compress_colors(self, pixels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Count unique colors of an N x 3 uint8 pixel array via packed 24-bit keys
+        
+        Images with more than MAX_UNIQUE_COLORS distinct colors are quantized
+        to 6, then 5 bits per channel; each bin is represented by the mean of
+        the pixels that fall into it.
+        """
+        pixels = pixels.astype(np.uint32)
+        
+        for bits in (8, 6, 5):
+            shift = 8 - bits
+            keys = ((pixels[:, 0] >> shift) << 16) | ((pixels[:, 1] >> shift) << 8) | (pixels[:, 2] >> shift)
+            unique_keys, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+            if len(unique_keys) <= self.MAX_UNIQUE_COLORS:
+                break
+        
+        if bits == 8:
+            colors = np.stack([unique_keys >> 16, (unique_keys >> 8) & 0xFF, unique_keys & 0xFF], axis=1)
+        else:
+            colors = np.stack([
+                np.bincount(inverse, weights=pixels[:, channel], minlength=len(unique_keys))
+                for channel in range(3)
+            ], axis=1) / counts[:, None]
+        
+        return colors.astype(float), counts.astype(float)
+    
+    def _cluster_range(self, colors: np.ndarray, weights: np.ndarray) -> Dict[int, List[str]]:
+        """Cluster weighted colors once and derive a palette for every k in range"""
+        colors = colors.astype(float)
+        
+        # Monotone images may have fewer distinct colors than MAX_COLORS;
+        # larger palettes are then padded with variations by _rank_colors
+        fit_k = max(1, min(self.MAX_COLORS, len(colors)))
+        
+        kmeans = KMeans(
+            n_clusters=fit_k,
+            random_state=42,
+            n_init=20,
+            max_iter=500
+        )
+        kmeans.fit(colors, sample_weight=weights)
+        
+        centers = list(kmeans.cluster_centers_)
+        counts = list(np.bincount(kmeans.labels_, weights=weights, minlength=fit_k))
+        level_centers, labels = kmeans.cluster_centers_, kmeans.labels_
+        palettes = {}
+        
+        for k in range(self.MAX_COLORS, self.MIN_COLORS - 1, -1):
+            if k < len(centers):
+                # Merge the pair with the smallest Ward cost
+                best = None
+                for i in range(len(centers)):
+                    for j in range(i + 1, len(centers)):
+                        n_i, n_j = counts[i], counts[j]
+                        cost = (n_i * n_j) / (n_i + n_j) * np.sum((centers[i] - centers[j]) ** 2)
+                        if best is None or cost < best[0]:
+                            best = (cost, i, j)
+                _, i, j = best
+                total = counts[i] + counts[j]
+                centers[i] = (centers[i] * counts[i] + centers[j] * counts[j]) / total
+                counts[i] = total
+                del centers[j]
+                del counts[j]
+                
+                # Short polish seeded from the merged centers
+                level = KMeans(n_clusters=k, init=np.array(centers), n_init=1, max_iter=50)
+                level.fit(colors, sample_weight=weights)
+                level_centers, labels = level.cluster_centers_, level.labels_
             
-            # If still too few, use original
-            if len(filtered_pixels) < 100:
-                filtered_pixels = pixels
+            palettes[k] = self._rank_colors(colors, weights, level_centers, labels, k)
+        
+        return palettes
+    
+    def _rank_colors(self, pixel_colors: np.ndarray, weights: np.ndarray, centers: np.ndarray, labels: np.ndarray, num_colors: int) -> List[str]:
+        """Score clusters of weighted colors, deduplicate and pad to num_colors hex codes"""
+        # Get cluster centers (dominant colors)
+        colors = centers.astype(int)
+        
+        # Calculate cluster importance based on:
+        # 1. Number of pixels in cluster
+        # 2. Total saturation of cluster
+        # 3. Variance within cluster (prefer coherent clusters)
+        sorted_colors = []
+        
+        for i in range(len(colors)):
+            in_cluster = labels == i
+            cluster_colors = pixel_colors[in_cluster]
+            cluster_weights = weights[in_cluster]
+            count = cluster_weights.sum()
+            if count == 0:
+                continue
             
-            # Sample pixels if too many (for performance)
-            # Increased to 25000 for MAXIMUM accuracy with more colors (15+)
-            max_pixels = 25000
-            if len(filtered_pixels) > max_pixels:
-                indices = np.random.choice(len(filtered_pixels), max_pixels, replace=False)
-                filtered_pixels = filtered_pixels[indices]
+            # Calculate saturation (weighted std of RGB values)
+            mean = np.average(cluster_colors, axis=0, weights=cluster_weights)
+            saturation = np.sqrt(np.average((cluster_colors - mean) ** 2, axis=0, weights=cluster_weights)).mean()
             
-            # Apply k-means clustering with more iterations for better accuracy
-            # Increased n_init from 10 to 20 for better convergence
-            kmeans = KMeans(
-                n_clusters=num_colors, 
-                random_state=42, 
-                n_init=20,
-                max_iter=500  # More iterations for better convergence
-            )
-            kmeans.fit(filtered_pixels)
+            # Calculate cluster coherence (inverse of weighted variance)
+            variance = np.average((cluster_colors - mean.mean()) ** 2, axis=0, weights=cluster_weights).mean()
+            coherence = 1.0 / (variance + 1.0)
             
-            # Get cluster centers (dominant colors)
-            colors = kmeans.cluster_centers_.astype(int)
+            # Combined score: count (60%), saturation (20%), coherence (20%)
+            score = (count * 0.6) + (saturation * count * 0.2) + (coherence * count * 0.2)
             
-            # Calculate cluster importance based on:
-            # 1. Number of pixels in cluster
-            # 2. Total saturation of cluster
-            # 3. Variance within cluster (prefer coherent clusters)
-            labels = kmeans.labels_
-            sorted_colors = []
+            sorted_colors.append((score, colors[i]))
+        
+        # Sort by importance score
+        sorted_colors.sort(reverse=True, key=lambda x: x[0])
+        
+        # Convert RGB to hex WITH MINIMAL DEDUPLICATION
+        # Only reject TRULY IDENTICAL colors, allow similar ones
+        hex_colors = []
+        unique_rgb_colors = []  # Store RGB tuples for deduplication
+        
+        for _, rgb in sorted_colors:
+            # Clamp values to valid range
+            r, g, b = np.clip(rgb, 0, 255).astype(int)
+            current_rgb = (int(r), int(g), int(b))
             
-            for i in range(num_colors):
-                cluster_pixels = filtered_pixels[labels == i]
-                count = len(cluster_pixels)
-                
-                # Calculate saturation (std of RGB values)
-                saturation = np.std(cluster_pixels, axis=0).mean()
+            # MINIMAL deduplication - only prevent IDENTICAL colors
+            is_unique = True
+            for existing_rgb in unique_rgb_colors:
+                # Calculate RGB distance
+                rgb_distance = np.sqrt(
+                    (current_rgb[0] - existing_rgb[0]) ** 2 +
+                    (current_rgb[1] - existing_rgb[1]) ** 2 +
+                    (current_rgb[2] - existing_rgb[2]) ** 2
+                )
                 
-                # Calculate cluster coherence (inverse of variance)
-                coherence = 1.0 / (np.var(cluster_pixels) + 1.0)
-                
-                # Combined score: count (60%), saturation (20%), coherence (20%)
-                score = (count * 0.6) + (saturation * count * 0.2) + (coherence * count * 0.2)
+                # ONLY reject if nearly identical (RGB distance < 10)
+                # This allows similar colors but prevents exact duplicates
+                if rgb_distance < 10:
+                    is_unique = False
+                    break
+            
+            # Only add if unique
+            if is_unique:
+                hex_color = f'#{r:02X}{g:02X}{b:02X}'
+                hex_colors.append(hex_color)
+                unique_rgb_colors.append(current_rgb)
                 
-                sorted_colors.append((score, colors[i]))
+                # Stop when we have enough unique colors
+                if len(hex_colors) >= num_colors:
+                    break
+        
+        # If we still don't have enough colors (very monotone image),
+        # generate varied versions with better distribution
+        max_attempts = num_colors * 20  # Prevent infinite loop
+        attempts = 0
+        
+        while len(hex_colors) < num_colors and len(unique_rgb_colors) > 0 and attempts < max_attempts:
+            attempts += 1
             
-            # Sort by importance score
-            sorted_colors.sort(reverse=True, key=lambda x: x[0])
+            # Cycle through base colors for variety
+            base_idx = (len(hex_colors) + attempts) % len(unique_rgb_colors)
+            base_rgb = unique_rgb_colors[base_idx]
             
-            # Convert RGB to hex WITH MINIMAL DEDUPLICATION
-            # Only reject TRULY IDENTICAL colors, allow similar ones
-            hex_colors = []
-            unique_rgb_colors = []  # Store RGB tuples for deduplication
+            # Create different types of variations with STRONGER differences
+            variation_type = attempts % 4
             
-            for _, rgb in sorted_colors:
-                # Clamp values to valid range
-                r, g, b = np.clip(rgb, 0, 255).astype(int)
-                current_rgb = (int(r), int(g), int(b))
-                
-                # MINIMAL deduplication - only prevent IDENTICAL colors
-                is_unique = True
-                for existing_rgb in unique_rgb_colors:
-                    # Calculate RGB distance
-                    rgb_distance = np.sqrt(
-                        (current_rgb[0] - existing_rgb[0]) ** 2 +
-                        (current_rgb[1] - existing_rgb[1]) ** 2 +
-                        (current_rgb[2] - existing_rgb[2]) ** 2
-                    )
-                    
-                    # ONLY reject if nearly identical (RGB distance < 10)
-                    # This allows similar colors but prevents exact duplicates
-                    if rgb_distance < 10:
-                        is_unique = False
-                        break
-                
-                # Only add if unique
-                if is_unique:
-                    hex_color = f'#{r:02X}{g:02X}{b:02X}'
-                    hex_colors.append(hex_color)
-                    unique_rgb_colors.append(current_rgb)
-                    
-                    # Stop when we have enough unique colors
-                    if len(hex_colors) >= num_colors:
-                        break
+            if variation_type == 0:
+                # Lighter (increased from 60 to 80)
+                varied_r = int(np.clip(base_rgb[0] + 80, 0, 255))
+                varied_g = int(np.clip(base_rgb[1] + 80, 0, 255))
+                varied_b = int(np.clip(base_rgb[2] + 80, 0, 255))
+            elif variation_type == 1:
+                # Darker (increased from 60 to 80)
+                varied_r = int(np.clip(base_rgb[0] - 80, 0, 255))
+                varied_g = int(np.clip(base_rgb[1] - 80, 0, 255))
+                varied_b = int(np.clip(base_rgb[2] - 80, 0, 255))
+            elif variation_type == 2:
+                # More saturated (increased from 0.5 to 0.7)
+                avg = (base_rgb[0] + base_rgb[1] + base_rgb[2]) // 3
+                varied_r = int(np.clip(base_rgb[0] + (base_rgb[0] - avg) * 0.7, 0, 255))
+                varied_g = int(np.clip(base_rgb[1] + (base_rgb[1] - avg) * 0.7, 0, 255))
+                varied_b = int(np.clip(base_rgb[2] + (base_rgb[2] - avg) * 0.7, 0, 255))
+            else:
+                # Less saturated (increased from 0.5 to 0.7)
+                avg = (base_rgb[0] + base_rgb[1] + base_rgb[2]) // 3
+                varied_r = int(np.clip(base_rgb[0] - (base_rgb[0] - avg) * 0.7, 0, 255))
+                varied_g = int(np.clip(base_rgb[1] - (base_rgb[1] - avg) * 0.7, 0, 255))
+                varied_b = int(np.clip(base_rgb[2] - (base_rgb[2] - avg) * 0.7, 0, 255))
             
-            # If we still don't have enough colors (very monotone image),
-            # generate varied versions with better distribution
-            max_attempts = num_colors * 20  # Prevent infinite loop
-            attempts = 0
+            varied_rgb = (varied_r, varied_g, varied_b)
             
-            while len(hex_colors) < num_colors and len(unique_rgb_colors) > 0 and attempts < max_attempts:
-                attempts += 1
-                
-                # Cycle through base colors for variety
-                base_idx = (len(hex_colors) + attempts) % len(unique_rgb_colors)
-                base_rgb = unique_rgb_colors[base_idx]
-                
-                # Create different types of variations with STRONGER differences
-                variation_type = attempts % 4
-                
-                if variation_type == 0:
-                    # Lighter (increased from 60 to 80)
-                    varied_r = int(np.clip(base_rgb[0] + 80, 0, 255))
-                    varied_g = int(np.clip(base_rgb[1] + 80, 0, 255))
-                    varied_b = int(np.clip(base_rgb[2] + 80, 0, 255))
-                elif variation_type == 1:
-                    # Darker (increased from 60 to 80)
-                    varied_r = int(np.clip(base_rgb[0] - 80, 0, 255))
-                    varied_g = int(np.clip(base_rgb[1] - 80, 0, 255))
-                    varied_b = int(np.clip(base_rgb[2] - 80, 0, 255))
-                elif variation_type == 2:
-                    # More saturated (increased from 0.5 to 0.7)
-                    avg = (base_rgb[0] + base_rgb[1] + base_rgb[2]) // 3
-                    varied_r = int(np.clip(base_rgb[0] + (base_rgb[0] - avg) * 0.7, 0, 255))
-                    varied_g = int(np.clip(base_rgb[1] + (base_rgb[1] - avg) * 0.7, 0, 255))
-                    varied_b = int(np.clip(base_rgb[2] + (base_rgb[2] - avg) * 0.7, 0, 255))
-                else:
-                    # Less saturated (increased from 0.5 to 0.7)
-                    avg = (base_rgb[0] + base_rgb[1] + base_rgb[2]) // 3
-                    varied_r = int(np.clip(base_rgb[0] - (base_rgb[0] - avg) * 0.7, 0, 255))
-                    varied_g = int(np.clip(base_rgb[1] - (base_rgb[1] - avg) * 0.7, 0, 255))
-                    varied_b = int(np.clip(base_rgb[2] - (base_rgb[2] - avg) * 0.7, 0, 255))
-                
-                varied_rgb = (varied_r, varied_g, varied_b)
+            # MINIMAL deduplication - only reject if nearly identical
+            is_unique = True
+            for existing_rgb in unique_rgb_colors:
+                rgb_distance = np.sqrt(
+                    (varied_rgb[0] - existing_rgb[0]) ** 2 +
+                    (varied_rgb[1] - existing_rgb[1]) ** 2 +
+                    (varied_rgb[2] - existing_rgb[2]) ** 2
+                )
                 
-                # MINIMAL deduplication - only reject if nearly identical
-                is_unique = True
-                for existing_rgb in unique_rgb_colors:
-                    rgb_distance = np.sqrt(
-                        (varied_rgb[0] - existing_rgb[0]) ** 2 +
-                        (varied_rgb[1] - existing_rgb[1]) ** 2 +
-                        (varied_rgb[2] - existing_rgb[2]) ** 2
-                    )
-                    
-                    # Only reject if RGB distance < 10 (nearly identical)
-                    if rgb_distance < 10:
-                        is_unique = False
-                        break
-                
-                # Add even if similar (user wants num_colors colors!)
-                if is_unique:
-                    hex_color = f'#{varied_r:02X}{varied_g:02X}{varied_b:02X}'
-                    hex_colors.append(hex_color)
-                    unique_rgb_colors.append(varied_rgb)
-            
-            return hex_colors
+                # Only reject if RGB distance < 10 (nearly identical)
+                if rgb_distance < 10:
+                    is_unique = False
+                    break
             
-        except Exception as e:
-            print(f"Error extracting colors from image: {e}")
-            raise ValueError(f"Failed to process image: {str(e)}")
+            # Add even if similar (user wants num_colors colors!)
+            if is_unique:
+                hex_color = f'#{varied_r:02X}{varied_g:02X}{varied_b:02X}'
+                hex_colors.append(hex_color)
+                unique_rgb_colors.append(varied_rgb)
+        
+        return hex_colors
     
     def rgb_to_hex(self, r: int, g: int, b: int) -> str:
         """Convert RGB values to hex color code"""
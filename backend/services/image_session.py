@@ -0,0 +1,78 @@
+"""In-memory image sessions so palettes can be re-queried without re-uploading"""
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services.color_engine import ColorEngine
+from services.session_store import SessionStore
+
+
+class ImageSession:
+    """Compact state kept for one uploaded image"""
+    
+    def __init__(self, filename: str, colors: np.ndarray, weights: np.ndarray, palettes: Dict[int, List[str]]):
+        self.image_id: Optional[str] = None
+        self.filename = filename
+        self.colors = colors          # Unique uint8 colors (N x 3)
+        self.weights = weights        # Pixel count per unique color
+        self.palettes = palettes      # {num_colors: [hex, ...]}
+        self.analyses: Dict[int, dict] = {}  # AI naming per num_colors
+    
+    def apply_analysis(self, analysis: dict):
+        """
+        Derive names for every palette size from one analysis of the largest palette
+        
+        Each color takes the name of its nearest (Lab) color in the largest
+        palette; assignment is greedy by distance so names are not reused.
+        If the analysis did not name every color of the largest palette
+        (e.g. keyword fallback), names are assigned by position instead.
+        """
+        largest = self.palettes[max(self.palettes)]
+        source = analysis.get('color_names', [])
+        named = [(hex_color, name) for hex_color, name in zip(largest, source) if name]
+        if len(named) < len(largest):
+            for k in self.palettes:
+                self.analyses[k] = {**analysis, 'color_names': [
+                    source[i] if i < len(source) and source[i] else f'Color {i+1}' for i in range(k)
+                ]}
+            return
+        source_names = [name for _, name in named]
+        source_lab = self._lab([hex_color for hex_color, _ in named])
+        
+        for k, hex_colors in self.palettes.items():
+            lab = self._lab(hex_colors)
+            dist = np.linalg.norm(lab[:, None, :] - source_lab[None, :, :], axis=2)
+            
+            names = [f'Color {i+1}' for i in range(len(hex_colors))]
+            used_colors, used_sources = set(), set()
+            for flat in np.argsort(dist, axis=None):
+                i, j = divmod(int(flat), dist.shape[1])
+                if i in used_colors or j in used_sources:
+                    continue
+                used_colors.add(i)
+                used_sources.add(j)
+                names[i] = source_names[j]
+            
+            self.analyses[k] = {**analysis, 'color_names': names}
+    
+    @staticmethod
+    def _lab(hex_colors: List[str]) -> np.ndarray:
+        rgb = [[v['r'], v['g'], v['b']] for v in map(ColorEngine.hex_to_rgb, hex_colors)]
+        return ColorEngine.rgb_array_to_lab(np.array(rgb, dtype=np.uint8))
+
+
+class ImageSessionStore(SessionStore[ImageSession]):
+    """TTL store of uploaded image sessions"""
+    
+    def __init__(self, ttl_seconds: Optional[int] = None, max_sessions: Optional[int] = None):
+        super().__init__(
+            ttl_seconds=ttl_seconds or int(os.getenv('IMAGE_SESSION_TTL', '900')),
+            max_sessions=max_sessions or int(os.getenv('IMAGE_SESSION_MAX', '256'))
+        )
+    
+    def create(self, filename: str, colors: np.ndarray, weights: np.ndarray, palettes: Dict[int, List[str]]) -> ImageSession:
+        """Store a new session and return it"""
+        session = ImageSession(filename, colors, weights, palettes)
+        session.image_id = self.add(session)
+        return session
@@ -0,0 +1,218 @@
+"""Background jobs: bounded worker pool with a TTL-evicted result store"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+
+class Job:
+    """One unit of background work and its outcome"""
+    
+    def __init__(self, kind: str, key: str, job_id: Optional[str] = None, status: str = 'queued',
+                 progress: float = 0.0, result: Optional[dict] = None, error: Optional[str] = None,
+                 created_at: Optional[float] = None, updated_at: Optional[float] = None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.key = key                # Content hash + parameters, used for deduplication
+        self.status = status          # queued | running | succeeded | failed
+        self.progress = progress
+        self.result = result
+        self.error = error
+        self.created_at = created_at or time.time()
+        self.updated_at = updated_at or self.created_at
+
+
+class MemoryJobStore:
+    """In-process job store with TTL eviction"""
+    
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, Job] = {}
+        self._keys: Dict[str, str] = {}
+        self._lock = threading.Lock()
+    
+    def save(self, job: Job):
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._keys[job.key] = job.job_id
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def find(self, key: str) -> Optional[Job]:
+        with self._lock:
+            job_id = self._keys.get(key)
+            return self._jobs.get(job_id) if job_id else None
+    
+    def fail_unfinished(self, error: str) -> int:
+        """Nothing survives a restart in memory, so there is nothing to fail"""
+        return 0
+    
+    def evict_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            for job_id in [i for i, job in self._jobs.items() if job.updated_at < cutoff]:
+                job = self._jobs.pop(job_id)
+                if self._keys.get(job.key) == job_id:
+                    del self._keys[job.key]
+
+
+class SQLiteJobStore:
+    """SQLite-backed job store, so results survive restarts"""
+    
+    COLUMNS = ('job_id', 'kind', 'key', 'status', 'progress', 'result', 'error', 'created_at', 'updated_at')
+    
+    def __init__(self, path: str, ttl_seconds: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY, kind TEXT, key TEXT, status TEXT, progress REAL,
+                    result TEXT, error TEXT, created_at REAL, updated_at REAL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key)")
+    
+    def save(self, job: Job):
+        with self._connect() as db:
+            db.execute(
+                f"INSERT OR REPLACE INTO jobs VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                (job.job_id, job.kind, job.key, job.status, job.progress,
+                 json.dumps(job.result) if job.result is not None else None,
+                 job.error, job.created_at, job.updated_at)
+            )
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._one("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+    
+    def find(self, key: str) -> Optional[Job]:
+        return self._one("SELECT * FROM jobs WHERE key = ? ORDER BY created_at DESC LIMIT 1", (key,))
+    
+    def fail_unfinished(self, error: str) -> int:
+        """Mark queued/running jobs left by a previous process as failed; returns the count"""
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE status IN ('queued', 'running')",
+                (error, time.time())
+            )
+            return cursor.rowcount
+    
+    def evict_expired(self):
+        with self._connect() as db:
+            db.execute("DELETE FROM jobs WHERE updated_at < ?", (time.time() - self.ttl_seconds,))
+    
+    def _one(self, sql: str, params: tuple) -> Optional[Job]:
+        with self._connect() as db:
+            row = db.execute(sql, params).fetchone()
+        if row is None:
+            return None
+        values = dict(zip(self.COLUMNS, row))
+        if values['result'] is not None:
+            values['result'] = json.loads(values['result'])
+        return Job(**values)
+    
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at capacity"""
+
+
+class JobManager:
+    """
+    Runs submitted jobs on a fixed pool of worker threads
+    
+    Submissions with the same key as a live (queued, running or succeeded)
+    job return that job instead of queueing duplicate work.
+    """
+    
+    def __init__(self):
+        ttl_seconds = int(os.getenv('JOB_RESULT_TTL', '3600'))
+        if os.getenv('JOB_STORE', 'memory') == 'sqlite':
+            self.store = SQLiteJobStore(os.getenv('JOB_SQLITE_PATH', 'data/jobs.sqlite3'), ttl_seconds)
+        else:
+            self.store = MemoryJobStore(ttl_seconds)
+        
+        # Jobs queued or running when the previous process died have no worker
+        # left; fail them so status polls end and resubmissions run again
+        orphaned = self.store.fail_unfinished("Interrupted by server restart")
+        if orphaned:
+            print(f"⚠️ Marked {orphaned} interrupted job(s) as failed")
+        
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=int(os.getenv('JOB_QUEUE_SIZE', '100')))
+        self._submit_lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+            for i in range(int(os.getenv('JOB_WORKERS', '2')))
+        ]
+        for worker in self._workers:
+            worker.start()
+    
+    def submit(self, kind: str, key: str, func: Callable[[Callable[[float], None]], dict]) -> Job:
+        """
+        Queue func(progress) -> result dict, or return the existing job for key
+        
+        Raises QueueFullError when the queue is at capacity.
+        """
+        with self._submit_lock:
+            self.store.evict_expired()
+            
+            existing = self.store.find(key)
+            if existing and existing.status != 'failed':
+                return existing
+            
+            # Saved before queueing so a fast worker's updates are never overwritten
+            job = Job(kind, key)
+            self.store.save(job)
+            try:
+                self._queue.put_nowait((job, func))
+            except queue.Full:
+                self._update(job, status='failed', error="Job queue is full")
+                raise QueueFullError("Job queue is full")
+            return job
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.store.get(job_id)
+    
+    def stats(self) -> dict:
+        return {'queued': self._queue.qsize(), 'queue_size': self._queue.maxsize, 'workers': len(self._workers)}
+    
+    def _work(self):
+        while True:
+            job, func = self._queue.get()
+            try:
+                job = self._update(job, status='running')
+                
+                def progress(fraction: float):
+                    nonlocal job
+                    job = self._update(job, progress=max(0.0, min(1.0, fraction)))
+                
+                result = func(progress)
+                job = self._update(job, status='succeeded', progress=1.0, result=result)
+            except Exception as e:
+                print(f"❌ Job {job.job_id} failed: {e}")
+                self._update(job, status='failed', error=str(e))
+            finally:
+                self._queue.task_done()
+    
+    def _update(self, job: Job, **changes) -> Job:
+        """
+        Save a new Job with the changes applied and return it
+        
+        Stored jobs are never mutated, so readers always see a complete
+        state (e.g. never "succeeded" without its result).
+        """
+        updated = Job(**{**vars(job), **changes, 'updated_at': time.time()})
+        self.store.save(updated)
+        return updated
@@ -0,0 +1,183 @@
+"""Server-side palette state for live editing with incremental recomputation"""
+import math
+import re
+from typing import Dict, List, Optional, Set
+
+from models.schemas import Color, ContrastCheck
+from services.color_engine import ColorEngine
+
+
+class LivePalette:
+    """
+    Holds one palette being edited and applies edit operations to it
+    
+    Each operation reports which color indices changed, so only those colors
+    and their adjacent ContrastChecks are recomputed and sent back.
+    """
+    
+    MIN_COLORS = 3
+    MAX_COLORS = 15
+    
+    # Per-color adjustment operations -> ColorEngine method
+    ADJUSTMENTS = {
+        'brightness': 'adjust_brightness',
+        'saturation': 'adjust_saturation',
+        'temperature': 'adjust_temperature',
+    }
+    
+    def __init__(self, hex_colors: List[str], names: Optional[List[str]] = None, theme: str = '', mood: Optional[str] = None):
+        self.color_engine = ColorEngine()
+        self.hex_colors = [self._valid_hex(h) for h in hex_colors]
+        if not self.MIN_COLORS <= len(self.hex_colors) <= self.MAX_COLORS:
+            raise ValueError(f"Palette must have between {self.MIN_COLORS} and {self.MAX_COLORS} colors")
+        
+        names = list(names or [])
+        self.names = [names[i] if i < len(names) else f'Color {i+1}' for i in range(len(self.hex_colors))]
+        self.theme = theme
+        self.mood = mood
+        self.contrast = [self._contrast(i) for i in range(len(self.hex_colors) - 1)]
+        self.unnamed: Set[int] = set()  # Indices edited since names were last generated
+        self.seq = 0
+    
+    def apply(self, op: dict) -> Set[int]:
+        """Apply one edit operation and return the indices of changed colors"""
+        kind = op.get('op')
+        size = len(self.hex_colors)
+        
+        if kind in self.ADJUSTMENTS:
+            adjust = getattr(self.color_engine, self.ADJUSTMENTS[kind])
+            factor = self._factor(op.get('factor', 0))
+            indices = [self._index(op['index'])] if op.get('index') is not None else range(len(self.hex_colors))
+            changed = {i for i in indices if self._set(i, adjust(self.hex_colors[i], factor))}
+        
+        elif kind == 'set':
+            i = self._index(op.get('index'))
+            changed = {i} if self._set(i, self._valid_hex(op.get('hex', ''))) else set()
+        
+        elif kind == 'swap':
+            a, b = self._index(op.get('a')), self._index(op.get('b'))
+            self.hex_colors[a], self.hex_colors[b] = self.hex_colors[b], self.hex_colors[a]
+            self.names[a], self.names[b] = self.names[b], self.names[a]
+            changed = {a, b} if a != b else set()
+            
+            # Names (and pending renames) travel with their colors
+            if (a in self.unnamed) != (b in self.unnamed):
+                self.unnamed ^= {a, b}
+            self._refresh_contrast(changed)
+            if changed:
+                self.seq += 1
+            return changed
+        
+        elif kind == 'num_colors':
+            changed = self._resize(op.get('value', len(self.hex_colors)))
+        
+        else:
+            raise ValueError(f"Unknown op: {kind}")
+        
+        self.unnamed |= changed
+        self._refresh_contrast(changed)
+        if changed or len(self.hex_colors) != size:
+            self.seq += 1
+        return changed
+    
+    def apply_names(self, names: List[str]) -> Dict[int, str]:
+        """Take new names for edited colors only; returns {index: name} that changed"""
+        updated = {}
+        for i in sorted(self.unnamed):
+            if i < len(self.hex_colors) and i < len(names) and names[i]:
+                self.names[i] = names[i]
+                updated[i] = names[i]
+        self.unnamed.clear()
+        return updated
+    
+    def state(self) -> dict:
+        """Full palette state"""
+        return {
+            'type': 'state',
+            'seq': self.seq,
+            'theme': self.theme,
+            'mood': self.mood,
+            'colors': [self._color(i).model_dump() for i in range(len(self.hex_colors))],
+            'contrast_info': [c.model_dump() for c in self.contrast],
+        }
+    
+    def delta(self, changed: Set[int]) -> dict:
+        """Compact update: changed colors and the adjacent contrast pairs only"""
+        pairs = self._affected_pairs(changed)
+        return {
+            'type': 'delta',
+            'seq': self.seq,
+            'length': len(self.hex_colors),
+            'colors': {i: self._color(i).model_dump() for i in sorted(changed) if i < len(self.hex_colors)},
+            'contrast': {p: self.contrast[p].model_dump() for p in sorted(pairs)},
+        }
+    
+    def _resize(self, size: int) -> Set[int]:
+        """Grow with harmony colors from the first color, or truncate"""
+        if isinstance(size, bool) or not isinstance(size, int) or not self.MIN_COLORS <= size <= self.MAX_COLORS:
+            raise ValueError(f"num_colors must be between {self.MIN_COLORS} and {self.MAX_COLORS}")
+        
+        current = len(self.hex_colors)
+        if size < current:
+            del self.hex_colors[size:]
+            del self.names[size:]
+            del self.contrast[size - 1:]
+            self.unnamed = {i for i in self.unnamed if i < size}
+            # The new last color has no right-hand neighbour left to report
+            return set()
+        
+        added = self.color_engine.generate_harmony_colors(self.hex_colors[0], size)[current:]
+        for offset, hex_color in enumerate(added):
+            self.hex_colors.append(hex_color)
+            self.names.append(f'Color {current + offset + 1}')
+            self.contrast.append(None)
+        return set(range(current, size))
+    
+    def _refresh_contrast(self, changed: Set[int]):
+        for pair in self._affected_pairs(changed):
+            self.contrast[pair] = self._contrast(pair)
+    
+    def _affected_pairs(self, changed: Set[int]) -> Set[int]:
+        """Contrast pair p compares colors p and p + 1"""
+        last_pair = len(self.hex_colors) - 2
+        return {p for i in changed for p in (i - 1, i) if 0 <= p <= last_pair}
+    
+    def _contrast(self, pair: int) -> ContrastCheck:
+        ratio = self.color_engine.calculate_contrast_ratio(self.hex_colors[pair], self.hex_colors[pair + 1])
+        wcag = self.color_engine.get_wcag_compliance(ratio)
+        return ContrastCheck(
+            ratio=wcag['ratio'],
+            aa_normal=wcag['aa_normal'],
+            aa_large=wcag['aa_large'],
+            aaa_normal=wcag['aaa_normal'],
+            aaa_large=wcag['aaa_large']
+        )
+    
+    def _color(self, i: int) -> Color:
+        hex_color = self.hex_colors[i]
+        return Color(hex=hex_color, rgb=self.color_engine.hex_to_rgb(hex_color), name=self.names[i])
+    
+    def _set(self, i: int, hex_color: str) -> bool:
+        if self.hex_colors[i] == hex_color:
+            return False
+        self.hex_colors[i] = hex_color
+        return True
+    
+    def _index(self, value) -> int:
+        # bool is an int subclass, but {"index": true} is not a valid index
+        if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value < len(self.hex_colors):
+            raise ValueError(f"Invalid color index: {value}")
+        return value
+    
+    @staticmethod
+    def _factor(value) -> float:
+        """Adjustment factor: a finite number, clamped to the ColorEngine range -1 to 1"""
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"Invalid factor: {value}")
+        return max(-1.0, min(1.0, float(value)))
+    
+    @staticmethod
+    def _valid_hex(value: str) -> str:
+        if not isinstance(value, str) or not re.fullmatch(r'#?[0-9A-Fa-f]{6}', value):
+            raise ValueError(f"Invalid hex color: {value}")
+        return '#' + value.lstrip('#').upper()
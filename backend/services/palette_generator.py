@@ -1,16 +1,59 @@
 """Main palette generation service combining AI and color theory"""
-from typing import List
+import os
+import re
+from typing import List, Optional
 from models.schemas import Color, Palette, ContrastCheck
 from services.ai_service import AIService
 from services.color_engine import ColorEngine
+from services.palette_index import PaletteIndex
+from services.session_store import SessionStore
+
+
+class PaletteSession:
+    """Analysis and colors kept so a palette can be refined incrementally"""
+    
+    def __init__(self, theme: str, analysis: dict, hex_colors: List[str]):
+        self.theme = theme
+        self.analysis = analysis
+        self.hex_colors = hex_colors
 
 
 class PaletteGenerator:
     """Generates color palettes using AI analysis and color theory"""
     
+    # Refinement hints applied locally through ColorEngine: phrase -> (method, factor)
+    LOCAL_ADJUSTMENTS = {
+        'darker': ('adjust_brightness', -0.5),
+        'lighter': ('adjust_brightness', 0.5),
+        'brighter': ('adjust_brightness', 0.5),
+        'warmer': ('adjust_temperature', 1.0),
+        'cooler': ('adjust_temperature', -1.0),
+        'colder': ('adjust_temperature', -1.0),
+        'muted': ('adjust_saturation', -0.7),
+        'desaturated': ('adjust_saturation', -0.7),
+        'less saturated': ('adjust_saturation', -0.7),
+        'less vibrant': ('adjust_saturation', -0.7),
+        'softer': ('adjust_saturation', -0.5),
+        'saturated': ('adjust_saturation', 0.7),
+        'vibrant': ('adjust_saturation', 0.7),
+        'bolder': ('adjust_saturation', 0.7),
+    }
+    
+    # Words that may accompany a local hint without changing its meaning
+    HINT_FILLER = {'more', 'much', 'a', 'bit', 'little', 'slightly', 'and', 'make', 'it', 'please', 'even', 'very', 'lot'}
+    
     def __init__(self):
         self.ai_service = AIService()
         self.color_engine = ColorEngine()
+        self.sessions = SessionStore[PaletteSession](
+            ttl_seconds=int(os.getenv('PALETTE_SESSION_TTL', '3600')),
+            max_sessions=int(os.getenv('PALETTE_SESSION_MAX', '1024'))
+        )
+        
+        # Library for similar-palette search, seeded on first start
+        self.palette_index = PaletteIndex()
+        if self.palette_index.size == 0:
+            self.palette_index.seed(entry['base_color'] for entry in AIService.FALLBACK_COLOR_MAP.values())
     
     def generate_palette(self, prompt: str, num_colors: int = 5) -> Palette:
         """Generate a complete color palette from text prompt"""
@@ -22,8 +65,77 @@ class PaletteGenerator:
         base_color = analysis.get('base_color', '#6366F1')
         hex_colors = self.color_engine.generate_harmony_colors(base_color, num_colors)
         
-        # Step 3: Create Color objects with names
-        color_names = analysis.get('color_names', [f'Color {i+1}' for i in range(num_colors)])
+        # Step 3-5: Name colors, check contrast and build the palette
+        palette = self.build_palette(hex_colors, analysis, theme=prompt)
+        
+        # Step 6: Generated palettes become searchable; image-derived ones are
+        # never indexed, so uploads stay private and cannot grow the library
+        self.palette_index.add(hex_colors)
+        
+        # Step 7: Keep the analysis so refinements can reuse it
+        palette.palette_id = self.sessions.add(PaletteSession(prompt, analysis, hex_colors))
+        return palette
+    
+    def refine_palette(self, palette_id: str, refinement_hint: str, num_colors: int = 5) -> Optional[Palette]:
+        """
+        Refine a previously generated palette without re-running the full analysis
+        
+        Simple hints ("darker", "warmer", "more muted") are applied locally;
+        anything else is sent to the AI as a compact delta on the cached analysis.
+        Returns None when the palette session is unknown or expired.
+        """
+        session = self.sessions.get(palette_id)
+        if session is None:
+            return None
+        
+        theme = f"{session.theme}, {refinement_hint}"
+        adjustments = self._parse_local_hint(refinement_hint)
+        
+        if adjustments is not None:
+            analysis = dict(session.analysis)
+            hex_colors = list(session.hex_colors)
+            if len(hex_colors) != num_colors:
+                hex_colors = self.color_engine.generate_harmony_colors(analysis.get('base_color', '#6366F1'), num_colors)
+            
+            for method, factor in adjustments:
+                adjust = getattr(self.color_engine, method)
+                hex_colors = [adjust(hex_color, factor) for hex_color in hex_colors]
+                analysis['base_color'] = adjust(analysis.get('base_color', hex_colors[0]), factor)
+        else:
+            analysis = self.ai_service.refine_analysis(session.analysis, refinement_hint)
+            base_color = analysis.get('base_color', '#6366F1')
+            hex_colors = self.color_engine.generate_harmony_colors(base_color, num_colors)
+        
+        palette = self.build_palette(hex_colors, analysis, theme=theme)
+        self.palette_index.add(hex_colors)
+        palette.palette_id = self.sessions.add(PaletteSession(theme, analysis, hex_colors))
+        return palette
+    
+    def find_similar(self, hex_colors: List[str], limit: int = 10) -> List[tuple]:
+        """Find the nearest indexed palettes by order-invariant Lab distance"""
+        return self.palette_index.search(hex_colors, limit=limit)
+    
+    def _parse_local_hint(self, refinement_hint: str) -> Optional[list]:
+        """Map a hint to ColorEngine adjustments, or None if it needs the AI"""
+        remaining = refinement_hint.lower()
+        adjustments = []
+        
+        # Longest phrases first so "less saturated" wins over "saturated"
+        for phrase in sorted(self.LOCAL_ADJUSTMENTS, key=len, reverse=True):
+            if re.search(rf'\b{phrase}\b', remaining):
+                adjustments.append(self.LOCAL_ADJUSTMENTS[phrase])
+                remaining = re.sub(rf'\b{phrase}\b', ' ', remaining)
+        
+        leftover = [word for word in re.findall(r'[a-z]+', remaining) if word not in self.HINT_FILLER]
+        if not adjustments or leftover:
+            return None
+        return adjustments
+    
+    def build_palette(self, hex_colors: List[str], analysis: dict, theme: str, default_mood: str = 'harmonious') -> Palette:
+        """Build a Palette from hex colors and an AI analysis result"""
+        
+        # Create Color objects with names
+        color_names = analysis.get('color_names', [f'Color {i+1}' for i in range(len(hex_colors))])
         colors = []
         
         for i, hex_color in enumerate(hex_colors):
@@ -36,7 +148,7 @@ class PaletteGenerator:
                 name=color_name
             ))
         
-        # Step 4: Calculate contrast information (between adjacent colors)
+        # Calculate contrast information (between adjacent colors)
         contrast_info = []
         for i in range(len(colors) - 1):
             ratio = self.color_engine.calculate_contrast_ratio(
@@ -53,11 +165,10 @@ class PaletteGenerator:
                 aaa_large=wcag['aaa_large']
             ))
         
-        # Step 5: Create and return palette
         return Palette(
             colors=colors,
-            theme=prompt,
-            mood=analysis.get('mood', 'harmonious'),
+            theme=theme,
+            mood=analysis.get('mood', default_mood),
             contrast_info=contrast_info
         )
     
@@ -0,0 +1,268 @@
+"""Memory-mapped palette library for perceptual similar-palette search"""
+import colorsys
+import os
+import threading
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+from services.color_engine import ColorEngine
+
+try:
+    import fcntl
+except ImportError:  # Windows: single writer is not enforced
+    fcntl = None
+
+
+class PaletteIndex:
+    """
+    Stores palettes as fixed-width Lab rows in memory-mapped .npy files
+    
+    Search is two-stage: a coarse order-invariant signature (mean and spread
+    of the palette in Lab) narrows the library to a candidate set, which is
+    then ranked by the exact symmetric Chamfer distance between color sets.
+    
+    Once the library is larger than the candidate set, results are
+    approximate: the signature does not bound the Chamfer distance, so some
+    true neighbours can be filtered out. On a 300k-palette library the
+    default 1024 candidates find ~78% of the exact top 10, with distances on
+    average ~2% above the exact ones (~7 ms); raise PALETTE_SEARCH_CANDIDATES
+    to trade latency for recall (2048: ~83%, ~10 ms).
+    
+    The library holds at most PALETTE_INDEX_MAX palettes; once full, new
+    palettes are not added. Only one process may write the files: the first
+    to open them takes an exclusive lock, and other processes open a
+    read-only snapshot of the library as it was when they started.
+    """
+    
+    MAX_COLORS = 15
+    SIGNATURE_DIMS = 6
+    INITIAL_CAPACITY = 4096
+    
+    def __init__(self, path: str = None, candidates: int = None, max_size: int = None):
+        self.path = path or os.getenv('PALETTE_INDEX_PATH', 'data/palette_index')
+        self.candidates = candidates or int(os.getenv('PALETTE_SEARCH_CANDIDATES', '1024'))
+        self.max_size = max_size or int(os.getenv('PALETTE_INDEX_MAX', '200000'))
+        self._lock = threading.Lock()
+        self._seen = set()
+        self.size = 0
+        self.writable = self._acquire_writer_lock()
+        self._open()
+    
+    def add(self, hex_colors: List[str]) -> bool:
+        """Add one palette; returns False if it is empty or already indexed"""
+        return self.add_many([hex_colors]) > 0
+    
+    def add_many(self, palettes: Iterable[List[str]]) -> int:
+        """Add palettes in bulk and return how many were new (0 when read-only or full)"""
+        palettes = [p[:self.MAX_COLORS] for p in palettes if p]
+        if not palettes or not self.writable:
+            return 0
+        
+        rgb = np.zeros((len(palettes), self.MAX_COLORS, 3), dtype=np.uint8)
+        counts = np.zeros(len(palettes), dtype=np.uint8)
+        for i, hex_colors in enumerate(palettes):
+            for j, hex_color in enumerate(hex_colors):
+                value = ColorEngine.hex_to_rgb(hex_color)
+                rgb[i, j] = (value['r'], value['g'], value['b'])
+            counts[i] = len(hex_colors)
+        
+        with self._lock:
+            # Skip palettes that are already indexed (or repeated in this batch)
+            keep = []
+            for i in range(len(palettes)):
+                if self.size + len(keep) >= self.max_size:
+                    break
+                key = rgb[i, :counts[i]].tobytes()
+                if key not in self._seen:
+                    self._seen.add(key)
+                    keep.append(i)
+            
+            if not keep:
+                return 0
+            if self.size + len(keep) >= self.max_size:
+                print(f"⚠️ Palette index is full ({self.max_size} palettes); new palettes are not indexed")
+            
+            lab = ColorEngine.rgb_array_to_lab(rgb[keep])
+            signatures = self._signatures(lab, counts[keep])
+            
+            self._reserve(self.size + len(keep))
+            end = self.size + len(keep)
+            self._rgb[self.size:end] = rgb[keep]
+            self._lab[self.size:end] = lab
+            self._signature[self.size:end] = signatures
+            self._signature_norm[self.size:end] = (signatures ** 2).sum(axis=1)
+            self._counts[self.size:end] = counts[keep]  # Written last: marks rows as filled
+            self.size = end
+        
+        return len(keep)
+    
+    def search(self, hex_colors: List[str], limit: int = 10, exclude_exact: bool = True) -> List[Tuple[List[str], float]]:
+        """Return up to `limit` (hex colors, distance) pairs nearest to the query palette"""
+        query_rgb = np.array(
+            [[v['r'], v['g'], v['b']] for v in map(ColorEngine.hex_to_rgb, hex_colors[:self.MAX_COLORS])],
+            dtype=np.uint8
+        )
+        query_lab = ColorEngine.rgb_array_to_lab(query_rgb).astype(np.float64)
+        query_signature = self._signatures(query_lab[None], np.array([len(query_lab)]))[0]
+        
+        with self._lock:
+            size = self.size
+            signature = self._signature[:size]
+            if size == 0:
+                return []
+            
+            # Stage 1: coarse filter on the signature (|s|^2 - 2 s.q, BLAS friendly)
+            coarse = self._signature_norm[:size] - 2 * (signature @ query_signature)
+            pool = min(size, self._pool(limit))
+            candidates = np.argpartition(coarse, pool - 1)[:pool] if pool < size else np.arange(size)
+            
+            cand_lab = np.asarray(self._lab[candidates], dtype=np.float64)
+            cand_counts = np.asarray(self._counts[candidates])
+            cand_rgb = np.asarray(self._rgb[candidates])
+        
+        # Stage 2: exact symmetric Chamfer distance (order-invariant), using
+        # |c - q|^2 = |c|^2 + |q|^2 - 2 c.q so the cross term is one matmul
+        valid = np.arange(self.MAX_COLORS)[None, :] < cand_counts[:, None]
+        cross = (cand_lab.reshape(-1, 3) @ query_lab.T).reshape(len(candidates), self.MAX_COLORS, len(query_lab))
+        dist2 = (cand_lab ** 2).sum(axis=2)[:, :, None] + (query_lab ** 2).sum(axis=1)[None, None, :] - 2 * cross
+        dist2 = np.where(valid[:, :, None], np.maximum(dist2, 0), np.inf)
+        
+        query_to_palette = np.sqrt(dist2.min(axis=1)).mean(axis=1)
+        palette_to_query = np.where(valid, np.sqrt(dist2.min(axis=2)), 0).sum(axis=1) / cand_counts
+        distance = (query_to_palette + palette_to_query) / 2
+        
+        results = []
+        for i in np.argsort(distance):
+            if exclude_exact and distance[i] < 1e-3:
+                continue
+            colors = [ColorEngine.rgb_to_hex(*map(int, rgb)) for rgb in cand_rgb[i, :cand_counts[i]]]
+            results.append((colors, round(float(distance[i]), 2)))
+            if len(results) >= limit:
+                break
+        
+        return results
+    
+    def is_exact(self, limit: int = 10) -> bool:
+        """Whether a search with this limit reranks the whole library exactly"""
+        return self.size <= self._pool(limit)
+    
+    def seed(self, base_colors: Iterable[str], sizes: range = range(3, 16)) -> int:
+        """Populate the index from harmony palettes of the given base colors and a hue sweep"""
+        bases = list(base_colors)
+        
+        # Sweep base colors across hue, lightness and saturation
+        for hue in range(0, 360, 15):
+            for lightness in (0.3, 0.45, 0.6, 0.75):
+                for saturation in (0.35, 0.6, 0.85):
+                    r, g, b = colorsys.hls_to_rgb(hue / 360, lightness, saturation)
+                    bases.append(ColorEngine.rgb_to_hex(int(r * 255), int(g * 255), int(b * 255)))
+        
+        return self.add_many(
+            ColorEngine.generate_harmony_colors(base, k) for base in bases for k in sizes
+        )
+    
+    def _pool(self, limit: int) -> int:
+        return max(self.candidates, limit * 8)
+    
+    def _signatures(self, lab: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """Order-invariant per-palette signature: Lab mean and standard deviation"""
+        valid = (np.arange(lab.shape[1])[None, :] < counts[:, None])[:, :, None]
+        n = counts[:, None].astype(np.float32)
+        mean = np.where(valid, lab, 0).sum(axis=1) / n
+        spread = np.sqrt((np.where(valid, lab - mean[:, None, :], 0) ** 2).sum(axis=1) / n)
+        return np.concatenate([mean, spread], axis=1).astype(np.float32)
+    
+    def _files(self):
+        return {
+            name: f"{self.path}.{name}.npy"
+            for name in ('rgb', 'lab', 'counts', 'signature')
+        }
+    
+    def _acquire_writer_lock(self) -> bool:
+        """Take the exclusive writer lock for this path; False if another process holds it"""
+        if fcntl is None:
+            return True
+        
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        # Kept open for the lifetime of the process; the lock is released on exit
+        self._lock_file = open(f"{self.path}.lock", 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            print(f"⚠️ Palette index {self.path} is written by another process; opening read-only")
+            return False
+    
+    def _open(self):
+        """Open existing memory-mapped files, or create empty ones"""
+        files = self._files()
+        mode = 'r+' if self.writable else 'r'
+        if all(os.path.exists(p) for p in files.values()):
+            self._rgb = np.load(files['rgb'], mmap_mode=mode)
+            self._lab = np.load(files['lab'], mmap_mode=mode)
+            self._counts = np.load(files['counts'], mmap_mode=mode)
+            self._signature = np.load(files['signature'], mmap_mode=mode)
+            
+            # Rows are filled front to back; unused capacity has count 0
+            filled = np.flatnonzero(self._counts)
+            self.size = int(filled[-1]) + 1 if len(filled) else 0
+            self._signature_norm = np.zeros(len(self._counts), dtype=np.float32)
+            self._signature_norm[:self.size] = (np.asarray(self._signature[:self.size]) ** 2).sum(axis=1)
+            
+            rgb = np.asarray(self._rgb[:self.size])
+            for i in range(self.size):
+                self._seen.add(rgb[i, :self._counts[i]].tobytes())
+        elif self.writable:
+            self._allocate(min(self.INITIAL_CAPACITY, self.max_size))
+        else:
+            # Nothing written yet by the writer process: an empty library
+            self._rgb = np.zeros((0, self.MAX_COLORS, 3), dtype=np.uint8)
+            self._lab = np.zeros((0, self.MAX_COLORS, 3), dtype=np.float32)
+            self._counts = np.zeros(0, dtype=np.uint8)
+            self._signature = np.zeros((0, self.SIGNATURE_DIMS), dtype=np.float32)
+            self._signature_norm = np.zeros(0, dtype=np.float32)
+    
+    def _reserve(self, needed: int):
+        """Grow the backing files (doubling) so `needed` rows fit (caller holds lock)"""
+        capacity = len(self._counts)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self._allocate(min(capacity, max(needed, self.max_size)))
+    
+    def _allocate(self, capacity: int):
+        """(Re)create the memory-mapped files with the given capacity, keeping existing rows"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        shapes = {
+            'rgb': ((capacity, self.MAX_COLORS, 3), np.uint8),
+            'lab': ((capacity, self.MAX_COLORS, 3), np.float32),
+            'counts': ((capacity,), np.uint8),
+            'signature': ((capacity, self.SIGNATURE_DIMS), np.float32),
+        }
+        
+        for name, path in self._files().items():
+            shape, dtype = shapes[name]
+            old = getattr(self, f"_{name}", None)
+            tmp_path = f"{path}.tmp"
+            array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=shape)
+            if old is not None and self.size:
+                array[:self.size] = old[:self.size]
+            array.flush()
+            del array
+            os.replace(tmp_path, path)
+            setattr(self, f"_{name}", np.load(path, mmap_mode='r+'))
+        
+        # Squared signature norms are kept in RAM only
+        norms = np.zeros(capacity, dtype=np.float32)
+        if self.size:
+            norms[:self.size] = self._signature_norm[:self.size]
+        self._signature_norm = norms
+
@@ -0,0 +1,110 @@
+"""Low-overhead sampling profiler for individual requests"""
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of a request's threads from a background thread"""
+    
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_ids = {thread_id}
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def start(self):
+        self._thread.start()
+    
+    def stop(self) -> Counter:
+        """Stop sampling and return {folded stack: sample count}"""
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.thread_ids):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                
+                self.stacks[';'.join(reversed(stack))] += 1
+
+
+# Profiler of the request being handled, if any
+active_profiler: ContextVar[Optional[SamplingProfiler]] = ContextVar('active_profiler', default=None)
+
+
+@contextmanager
+def profiled_thread():
+    """Include the current (worker) thread in the active request profile"""
+    profiler = active_profiler.get()
+    if profiler is None:
+        yield
+        return
+    
+    thread_id = threading.get_ident()
+    profiler.thread_ids.add(thread_id)
+    try:
+        yield
+    finally:
+        profiler.thread_ids.discard(thread_id)
+
+
+class ProfileStore:
+    """Keeps the most recent profiles as collapsed-stack (.folded) files"""
+    
+    def __init__(self, directory: Optional[str] = None, max_files: Optional[int] = None):
+        self.directory = directory or os.getenv('PROFILE_DIR', 'data/profiles')
+        self.max_files = max_files or int(os.getenv('PROFILE_MAX_FILES', '50'))
+        os.makedirs(self.directory, exist_ok=True)
+    
+    def save(self, stacks: Counter, label: str, duration_ms: float) -> str:
+        """Write stacks in flamegraph.pl / speedscope folded format and return the file name"""
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', label).strip('-')[:60]
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}-{slug}-{int(duration_ms)}ms.folded"
+        
+        with open(os.path.join(self.directory, name), 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        
+        self._prune()
+        return name
+    
+    def list(self) -> List[dict]:
+        """Recent profiles, newest first"""
+        profiles = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if name.endswith('.folded'):
+                path = os.path.join(self.directory, name)
+                profiles.append({'name': name, 'size': os.path.getsize(path)})
+        return profiles
+    
+    def path(self, name: str) -> Optional[str]:
+        """Path of a stored profile, or None if it does not exist"""
+        if os.path.basename(name) != name or not name.endswith('.folded'):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+    
+    def _prune(self):
+        """Delete the oldest profiles beyond max_files"""
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith('.folded'))
+        for name in names[:-self.max_files]:
+            os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,61 @@
+"""Thread-safe in-memory TTL store for short-lived server-side sessions"""
+import threading
+import time
+import uuid
+from typing import Dict, Generic, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class SessionStore(Generic[T]):
+    """Keeps values under random ids, evicting idle and least recently used entries"""
+    
+    def __init__(self, ttl_seconds: int, max_sessions: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._values: Dict[str, T] = {}
+        self._last_access: Dict[str, float] = {}
+        self._lock = threading.Lock()
+    
+    def add(self, value: T) -> str:
+        """Store a value and return its new id"""
+        key = uuid.uuid4().hex
+        
+        with self._lock:
+            self._evict_expired()
+            
+            # Drop least recently used entries when full
+            while len(self._values) >= self.max_sessions:
+                oldest = min(self._last_access, key=self._last_access.get)
+                self._remove(oldest)
+            
+            self._values[key] = value
+            self._last_access[key] = time.monotonic()
+        
+        return key
+    
+    def get(self, key: str) -> Optional[T]:
+        """Return a live value (refreshing its TTL) or None"""
+        with self._lock:
+            self._evict_expired()
+            value = self._values.get(key)
+            if value is not None:
+                self._last_access[key] = time.monotonic()
+            return value
+    
+    def __len__(self) -> int:
+        with self._lock:
+            self._evict_expired()
+            return len(self._values)
+    
+    def _remove(self, key: str):
+        """Remove one entry (caller holds lock)"""
+        self._values.pop(key, None)
+        self._last_access.pop(key, None)
+    
+    def _evict_expired(self):
+        """Remove entries idle for longer than the TTL (caller holds lock)"""
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [key for key, accessed in self._last_access.items() if accessed < cutoff]
+        for key in expired:
+            self._remove(key)
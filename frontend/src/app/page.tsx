@@ -76,6 +76,7 @@ export default function Home() {
           original_prompt: `colors from ${uploadedImage.name}`,
           refinement_hint: hint,
           num_colors: currentPalette?.colors.length || 5,
+          palette_id: currentPalette?.palette_id,
         });
       } else {
         // No image, just text-based refinement
@@ -85,6 +86,7 @@ export default function Home() {
           original_prompt: `${originalPrompt || currentPalette?.theme || ''} (current colors: ${currentColors})`,
           refinement_hint: hint,
           num_colors: currentPalette?.colors.length || 5,
+          palette_id: currentPalette?.palette_id,
         });
       }
 
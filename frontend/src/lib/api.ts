@@ -24,6 +24,7 @@ export interface RefinePaletteRequest {
     original_prompt: string;
     refinement_hint: string;
     num_colors?: number;
+    palette_id?: string;
 }
 
 export const paletteApi = {
@@ -40,6 +41,7 @@ export const paletteApi = {
             original_prompt: request.original_prompt,
             refinement_hint: request.refinement_hint,
             num_colors: request.num_colors || 5,
+            palette_id: request.palette_id,
         });
         return response.data;
     },
@@ -55,6 +57,17 @@ export const paletteApi = {
         return response.data;
     },
 
+    extractColorsFromPixels: async (imageData: ImageData, numColors: number = 5): Promise<Palette> => {
+        // Canvas pixels are sent as raw RGBA bytes, so no encode/decode is needed
+        const params = `width=${imageData.width}&height=${imageData.height}&channels=4&num_colors=${numColors}`;
+        const response = await api.post<Palette>(`/extract-colors/raw?${params}`, imageData.data, {
+            headers: {
+                'Content-Type': 'application/octet-stream',
+            },
+        });
+        return response.data;
+    },
+
     analyzeContrast: async (request: AnalyzeColorRequest) => {
         const response = await api.post('/analyze', request);
         return response.data;
@@ -19,6 +19,7 @@ export interface Palette {
   theme: string;
   mood?: string;
   contrast_info?: ContrastCheck[];
+  palette_id?: string;
 }
 
 interface PaletteStore {